@@ -0,0 +1,53 @@
+import io
+import os
+import shutil
+import tarfile
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks, such as a Docker archive stream"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def extract_file(chunks, destination):
+    """Unpack the first regular file of a tar stream into ``destination``.
+
+    The archive is read sequentially and the member is copied in COPY_BUFFER_SIZE pieces,
+    so memory use does not grow with the file. The file is written next to ``destination``
+    and moved into place once complete. Returns the number of bytes written.
+    """
+    stream = io.BufferedReader(ChunkStream(chunks), COPY_BUFFER_SIZE)
+    with tarfile.open(fileobj=stream, mode='r|') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            partial = f"{destination}.part"
+            try:
+                with open(partial, 'wb') as f:
+                    shutil.copyfileobj(archive.extractfile(member), f, COPY_BUFFER_SIZE)
+                os.replace(partial, destination)
+            except BaseException:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                raise
+            return member.size
+    raise FileNotFoundError("Archive contains no regular file")
@@ -0,0 +1,89 @@
+import os
+from placement_optimizer import MAX_FILL_VOLUME
+
+# Air cleared around a build's extent, in blocks
+AREA_MARGIN = int(os.getenv('AREA_MARGIN', '4'))
+
+# World height of 1.18+ overworlds
+WORLD_MIN_Y = -64
+WORLD_MAX_Y = 319
+
+# forceload refuses to add more chunks than this in one command
+FORCELOAD_MAX_CHUNKS = 256
+
+
+def operations_extent(operations):
+    """Bounding box (x1, y1, z1, x2, y2, z2) of every block recorded operations touch, or None"""
+    if not operations:
+        return None
+    low = [float('inf')] * 3
+    high = [float('-inf')] * 3
+    for operation in operations:
+        if operation[0] == 'setblock':
+            corners = (operation[1:4],)
+        else:
+            corners = (operation[1:4], operation[4:7])
+        for corner in corners:
+            for axis, value in enumerate(corner):
+                low[axis] = min(low[axis], value)
+                high[axis] = max(high[axis], value)
+    return (*low, *high)
+
+
+def expand_box(box, margin=AREA_MARGIN, offset=(0, 0, 0), limits=None):
+    """Grow a box by ``margin`` sideways and upwards, shift it by ``offset`` and clip it to the
+    world height and ``limits``, an optional (x1, z1, x2, z2) area. Returns None if nothing is left.
+
+    The box is not grown downwards, so the ground under a build is never dug out.
+    """
+    x1, y1, z1, x2, y2, z2 = box
+    ox, oy, oz = offset
+    x1, y1, z1 = x1 + ox - margin, max(y1 + oy, WORLD_MIN_Y), z1 + oz - margin
+    x2, y2, z2 = x2 + ox + margin, min(y2 + oy + margin, WORLD_MAX_Y), z2 + oz + margin
+    if limits:
+        lx1, lz1, lx2, lz2 = limits
+        x1, z1, x2, z2 = max(x1, lx1), max(z1, lz1), min(x2, lx2), min(z2, lz2)
+    if x1 > x2 or y1 > y2 or z1 > z2:
+        return None
+    return (x1, y1, z1, x2, y2, z2)
+
+
+def split_region(box, max_volume=MAX_FILL_VOLUME):
+    """Split a box into boxes of at most ``max_volume`` blocks.
+
+    Pieces span whole rows along x, then whole layers along z, then as many layers as fit
+    along y, so a region that fits is one command and large regions become flat slabs.
+    """
+    x1, y1, z1, x2, y2, z2 = box
+    step_x = min(x2 - x1 + 1, max_volume)
+    step_z = min(z2 - z1 + 1, max(1, max_volume // step_x))
+    step_y = min(y2 - y1 + 1, max(1, max_volume // (step_x * step_z)))
+    pieces = []
+    for y in range(y1, y2 + 1, step_y):
+        for z in range(z1, z2 + 1, step_z):
+            for x in range(x1, x2 + 1, step_x):
+                pieces.append((x, y, z, min(x + step_x - 1, x2), min(y + step_y - 1, y2), min(z + step_z - 1, z2)))
+    return pieces
+
+
+def region_fill_commands(box, block='air', relative=False, max_volume=MAX_FILL_VOLUME):
+    """fill commands setting every block of a box, each within the fill limit.
+
+    With ``relative`` the box is an offset from the command's position (~x ~y ~z).
+    """
+    prefix = '~' if relative else ''
+    return [f"fill {prefix}{x1} {prefix}{y1} {prefix}{z1} {prefix}{x2} {prefix}{y2} {prefix}{z2} {block}"
+            for x1, y1, z1, x2, y2, z2 in split_region(box, max_volume)]
+
+
+def forceload_commands(box, action='add'):
+    """forceload commands covering the chunks under a box, at most FORCELOAD_MAX_CHUNKS each"""
+    x1, _, z1, x2, _, z2 = box
+    cx1, cz1, cx2, cz2 = x1 >> 4, z1 >> 4, x2 >> 4, z2 >> 4
+    side = int(FORCELOAD_MAX_CHUNKS ** 0.5)
+    commands = []
+    for cz in range(cz1, cz2 + 1, side):
+        for cx in range(cx1, cx2 + 1, side):
+            commands.append(f"forceload {action} {cx * 16} {cz * 16} "
+                            f"{min(cx + side - 1, cx2) * 16 + 15} {min(cz + side - 1, cz2) * 16 + 15}")
+    return commands
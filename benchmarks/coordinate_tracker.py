@@ -0,0 +1,56 @@
+"""Scaling benchmark for CoordinateTracker.
+
+Run from the repository root:
+
+    python -m benchmarks.coordinate_tracker
+
+Per-coordinate cost should stay flat as the number of coordinates grows. The previous
+list-of-dicts tracker, which rebuilt the bounding box on every add, is timed alongside
+for the sizes where it still finishes in reasonable time.
+"""
+import time
+import random
+from coordinate_tracker import CoordinateTracker
+
+
+class ListOfDictsTracker:
+    """The tracker as it was before: one dict per coordinate, bounding box rebuilt on every add"""
+
+    def __init__(self):
+        self.coordinates = []
+        self.boundingBox = None
+
+    def addCoordinate(self, x, y, z):
+        self.coordinates.append({'x': x, 'y': y, 'z': z})
+        xs = [c['x'] for c in self.coordinates]
+        ys = [c['y'] for c in self.coordinates]
+        zs = [c['z'] for c in self.coordinates]
+        self.boundingBox = {
+            'min': {'x': min(xs), 'y': min(ys), 'z': min(zs)},
+            'max': {'x': max(xs), 'y': max(ys), 'z': max(zs)}
+        }
+
+
+def time_adds(tracker_class, coordinates):
+    tracker = tracker_class()
+    start = time.perf_counter()
+    for x, y, z in coordinates:
+        tracker.addCoordinate(x, y, z)
+    return time.perf_counter() - start
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'coordinates':>12} {'total s':>10} {'ns/add':>10} {'legacy ns/add':>14}")
+    for size in (1000, 10000, 100000, 1000000):
+        coordinates = [(rng.randrange(-500, 500), rng.randrange(-64, 320), rng.randrange(-500, 500))
+                       for _ in range(size)]
+        elapsed = time_adds(CoordinateTracker, coordinates)
+        legacy = ''
+        if size <= 10000:
+            legacy = f"{time_adds(ListOfDictsTracker, coordinates) / size * 1e9:14.0f}"
+        print(f"{size:>12} {elapsed:>10.3f} {elapsed / size * 1e9:>10.0f} {legacy:>14}")
+
+
+if __name__ == '__main__':
+    main()
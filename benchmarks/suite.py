@@ -0,0 +1,216 @@
+"""Micro-benchmarks for the orchestrator's per-operation hot paths.
+
+Run from the repository root:
+
+    python -m benchmarks.suite                                # full run, 10 to 1M blocks
+    python -m benchmarks.suite --max-size 10000               # quick run
+    python -m benchmarks.suite --output results.json          # machine-readable results
+    python -m benchmarks.suite --max-size 100000 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --max-size 100000 --baseline benchmarks/baseline.json
+
+Every case runs on a synthetic build of the given number of blocks and reports the best of
+a few repeats as nanoseconds per operation. With --baseline, cases that got slower than
+the baseline by more than --tolerance are listed and the exit status is 1. Baselines are
+only comparable on the same machine and Python version.
+"""
+import sys
+import json
+import time
+import base64
+import random
+import logging
+import argparse
+import platform
+from build_commands import block_state, setblock_command, worldedit_save_commands
+from placement_optimizer import PlacementBuffer, MAX_FILL_VOLUME
+from coordinate_tracker import CoordinateTracker
+from command_queue import CommandQueue
+from build_service import decode_job_message
+from mineflayer import BuildContext
+
+SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+BLOCK_TYPES = ('stone', 'oak_planks', 'glass', 'minecraft:spruce_log', 'white_wool', 'oak_stairs')
+
+
+def synthetic_build(size, seed=0):
+    """A solid, roughly cubic build of ``size`` placements as (x, y, z, block_type, block_states)"""
+    rng = random.Random(seed)
+    side = max(1, round(size ** (1 / 3)))
+    blocks = []
+    for i in range(size):
+        x, z, y = i % side, (i // side) % side, i // (side * side)
+        block_type = BLOCK_TYPES[(y + rng.randrange(2)) % len(BLOCK_TYPES)]
+        states = {'facing': 'north', 'half': 'bottom'} if block_type == 'oak_stairs' else None
+        blocks.append((x, y, z, block_type, states))
+    return blocks
+
+
+class NullTransport:
+    """Accepts command batches without sending them, isolating CommandQueue overhead"""
+    batch_size = 256
+
+    def send(self, commands):
+        return [''] * len(commands)
+
+
+def bench_build_context(blocks):
+    # The safeSetBlock/safeFill path: coalescing, bounds tracking and recording, one fill per 16 placements
+    context = BuildContext(CommandQueue(NullTransport()), origin=(0, -60, 0))
+    for i, (x, y, z, block_type, states) in enumerate(blocks):
+        block = block_state(block_type, states)
+        if i % 16:
+            context.setBlock(x, y, z, block)
+        else:
+            context.fill(x, y, z, x + 3, y, z + 3, block, 'replace', 'minecraft:air')
+    context.flush()
+    context.commandQueue.waitDrained()
+
+
+def bench_placement_buffer(blocks):
+    commands = []
+    buffer = PlacementBuffer(commands.append, MAX_FILL_VOLUME)
+    for x, y, z, block_type, states in blocks:
+        buffer.set_block(x, y, z, block_state(block_type, states))
+    buffer.flush()
+
+
+def bench_coordinate_tracker(blocks):
+    tracker = CoordinateTracker()
+    for x, y, z, _, _ in blocks:
+        tracker.addCoordinate(x, y, z)
+    tracker.getBoundingBox()
+
+
+def bench_command_queue(commands):
+    queue = CommandQueue(NullTransport())
+    for command in commands:
+        queue.add(command)
+    queue.waitDrained()
+
+
+def bench_job_decoding(messages):
+    for message in messages:
+        decode_job_message(message)
+
+
+def bench_save_structure(tracker):
+    worldedit_save_commands(tracker.getBoundingBox(), 'benchmark')
+
+
+def job_message(i):
+    body = [[{'function_definition': "safeSetBlock(0, 0, 0, 'stone')", 'metadata': {'name': f'job {i}'}}], {}, {}]
+    return json.dumps({
+        'body': base64.b64encode(json.dumps(body).encode()).decode(),
+        'headers': {'id': f'{i:032x}', 'task': 'minecraft_builder.build_structure'},
+        'content-type': 'application/json',
+    })
+
+
+def filled_tracker(blocks):
+    tracker = CoordinateTracker()
+    for x, y, z, _, _ in blocks:
+        tracker.addCoordinate(x, y, z)
+    return tracker
+
+
+# name -> (prepare input from a synthetic build, benchmark, operations per run, largest size)
+CASES = {
+    'build_context': (lambda blocks: blocks, bench_build_context, len, None),
+    'placement_buffer': (lambda blocks: blocks, bench_placement_buffer, len, None),
+    'coordinate_tracker': (lambda blocks: blocks, bench_coordinate_tracker, len, None),
+    'command_queue': (lambda blocks: [setblock_command(x, y, z, 'minecraft:stone') for x, y, z, _, _ in blocks],
+                      bench_command_queue, len, None),
+    'job_decoding': (lambda blocks: [job_message(i) for i in range(len(blocks))], bench_job_decoding, len, 100000),
+    'save_structure': (filled_tracker, bench_save_structure, lambda tracker: 1, None),
+}
+
+
+def time_case(func, data, repeats, min_time=0.05):
+    """Best seconds per call, calling often enough per repeat that timer noise does not matter"""
+    def measure(number):
+        start = time.perf_counter()
+        for _ in range(number):
+            func(data)
+        return time.perf_counter() - start
+
+    number = 1
+    elapsed = measure(number)
+    while elapsed < min_time:
+        number *= 10
+        elapsed = measure(number)
+    best = min([elapsed] + [measure(number) for _ in range(repeats - 1)])
+    return best / number
+
+
+def run(sizes, cases):
+    results = {}
+    for size in sizes:
+        blocks = synthetic_build(size)
+        repeats = 5 if size <= 10000 else 3 if size <= 100000 else 1
+        for name in cases:
+            prepare, func, operations, max_size = CASES[name]
+            if max_size and size > max_size:
+                continue
+            data = prepare(blocks)
+            seconds = time_case(func, data, repeats)
+            ops = operations(data)
+            results[f'{name}/{size}'] = {
+                'case': name,
+                'size': size,
+                'seconds': seconds,
+                'ns_per_op': seconds / ops * 1e9,
+            }
+            print(f"{name:>20} {size:>9} {seconds:>10.4f}s {seconds / ops * 1e9:>12.0f} ns/op", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return (key, ratio) for every case slower than its baseline by more than tolerance"""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline['results'].get(key)
+        if not reference:
+            continue
+        ratio = result['ns_per_op'] / reference['ns_per_op']
+        if ratio > 1 + tolerance:
+            regressions.append((key, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-size', type=int, default=SIZES[-1], help='largest synthetic build size')
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against the results stored in this file')
+    parser.add_argument('--save-baseline', help='store the results as a baseline in this file')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed slowdown against the baseline before failing (default: 0.5)')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # CommandQueue logs every drained queue
+
+    sizes = [size for size in SIZES if size <= args.max_size]
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': run(sizes, args.cases),
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline, args.tolerance)
+        for key, ratio in regressions:
+            print(f"REGRESSION {key}: {ratio:.2f}x the baseline")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+SETBLOCK_MODES = ['replace', 'destroy', 'keep']
+FILL_MODES = ['destroy', 'hollow', 'keep', 'outline', 'replace']
+
+
+def full_block_name(block_type):
+    """Add the minecraft: namespace if not present"""
+    return block_type if ':' in block_type else f'minecraft:{block_type}'
+
+
+def block_state(block_type, block_states=None):
+    """Format a block with optional block states, e.g. minecraft:oak_stairs[facing=north]"""
+    full_block_type = full_block_name(block_type)
+    if block_states:
+        state_string = ','.join([f"{key}={value}" for key, value in block_states.items()])
+        return f'{full_block_type}[{state_string}]'
+    return full_block_type
+
+
+def setblock_command(x, y, z, block, mode=None):
+    command = f"/setblock {x} {y} {z} {block}"
+    if mode:
+        if mode not in SETBLOCK_MODES:
+            raise ValueError(f"Invalid placement mode: {mode}. Must be one of: {', '.join(SETBLOCK_MODES)}")
+        command += f' {mode}'
+    return command
+
+
+def fill_command(x1, y1, z1, x2, y2, z2, block, mode=None, replace_filter=None):
+    command = f"/fill {x1} {y1} {z1} {x2} {y2} {z2} {block}"
+    if mode:
+        if mode not in FILL_MODES:
+            raise ValueError(f"Invalid fill mode: {mode}. Must be one of: {', '.join(FILL_MODES)}")
+        command += f' {mode}'
+        # The replace filter only applies to replace mode
+        if mode == 'replace' and replace_filter:
+            command += f' {replace_filter}'
+    return command
+
+
+def worldedit_save_commands(bounding_box, name):
+    """WorldEdit commands selecting a bounding box and saving it as schematic ``name``"""
+    low, high = bounding_box['min'], bounding_box['max']
+    return [
+        f"//pos1 {low['x']},{low['y']},{low['z']}",
+        f"//pos2 {high['x']},{high['y']},{high['z']}",
+        "//copy",  # Copy the selection to clipboard
+        f"//schem save {name}",  # Save the copied selection to a schematic file
+        "//schem list",  # Verify the save worked
+    ]
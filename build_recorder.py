@@ -0,0 +1,16 @@
+class BuildRecorder:
+    """Records the block operations of a build so the result can be reconstructed without a server.
+
+    Operations are kept in issue order as ('setblock', x, y, z, block, mode) and
+    ('fill', x1, y1, z1, x2, y2, z2, block, mode, replace_filter) tuples, with fully
+    formatted block states. voxel_simulator.replay_operations turns them into blocks.
+    """
+
+    def __init__(self):
+        self.operations = []
+
+    def set_block(self, x, y, z, block, mode=None):
+        self.operations.append(('setblock', x, y, z, block, mode))
+
+    def fill(self, x1, y1, z1, x2, y2, z2, block, mode=None, replace_filter=None):
+        self.operations.append(('fill', x1, y1, z1, x2, y2, z2, block, mode, replace_filter))
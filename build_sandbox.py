@@ -0,0 +1,88 @@
+import os
+import signal
+import logging
+import resource
+import threading
+import multiprocessing
+from voxel_simulator import record_operations, MAX_SIMULATED_OPERATIONS
+
+# Limits for running a job's build function
+SANDBOX_WORKERS = int(os.getenv('SANDBOX_WORKERS', str(os.cpu_count() or 1)))  # Build functions run at once
+SANDBOX_CPU_SECONDS = int(os.getenv('SANDBOX_CPU_SECONDS', '60'))
+SANDBOX_MEMORY_MB = int(os.getenv('SANDBOX_MEMORY_MB', '1024'))
+SANDBOX_TIMEOUT = float(os.getenv('SANDBOX_TIMEOUT', '120'))  # Wall clock seconds
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxError(Exception):
+    pass
+
+
+def _execute(function_definition, cpu_seconds, memory_bytes, max_operations, connection):
+    """Worker process entry point: apply the limits, run the build function, send back its operations"""
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    try:
+        connection.send(('ok', record_operations(function_definition, max_operations)))
+    except MemoryError:
+        connection.send(('error', f"MemoryError: build exceeded {memory_bytes // (1024 * 1024)}MB"))
+    except BaseException as e:
+        connection.send(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+
+class BuildSandbox:
+    """Runs build functions in short-lived worker processes with CPU time, memory and wall clock limits.
+
+    Workers are forked from a forkserver that has the build modules preloaded, so starting
+    one costs milliseconds and never inherits the orchestrator's threads or sockets. The
+    build function only records its safeSetBlock/safeFill calls; the operations are sent
+    back and replayed against the server by the caller. A worker that runs past the
+    timeout is killed.
+    """
+
+    def __init__(self, workers=SANDBOX_WORKERS, cpu_seconds=SANDBOX_CPU_SECONDS, memory_mb=SANDBOX_MEMORY_MB,
+                 timeout=SANDBOX_TIMEOUT, max_operations=MAX_SIMULATED_OPERATIONS):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self.timeout = timeout
+        self.max_operations = max_operations
+        self.slots = threading.BoundedSemaphore(workers)
+        self.context = multiprocessing.get_context('forkserver')
+        self.context.set_forkserver_preload(['__main__', 'build_sandbox'])
+
+    def run(self, function_definition):
+        """Run a build function and return the operations it recorded. Raises SandboxError on failure."""
+        with self.slots:
+            receiver, sender = self.context.Pipe(duplex=False)
+            process = self.context.Process(
+                target=_execute,
+                args=(function_definition, self.cpu_seconds, self.memory_bytes, self.max_operations, sender),
+                daemon=True
+            )
+            process.start()
+            sender.close()
+            try:
+                if not receiver.poll(self.timeout):
+                    raise SandboxError(f"Build function did not finish within {self.timeout} seconds")
+                status, payload = receiver.recv()
+            except EOFError:
+                process.join(1)
+                raise SandboxError(self._describe_exit(process.exitcode))
+            finally:
+                receiver.close()
+                if process.is_alive():
+                    process.kill()
+                process.join()
+
+        if status != 'ok':
+            raise SandboxError(payload)
+        logger.info(f"Build function recorded {len(payload)} operations")
+        return payload
+
+    def _describe_exit(self, exitcode):
+        if exitcode == -signal.SIGXCPU or exitcode == -signal.SIGKILL:
+            return f"Build function exceeded {self.cpu_seconds}s of CPU time"
+        return f"Build function worker exited unexpectedly with code {exitcode}"
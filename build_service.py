@@ -1,5 +1,9 @@
 import asyncio
+import functools
 from server_manager import MinecraftServerManager
+from result_publisher import ResultPublisher
+from result_cache import ResultCache, build_key, RESULT_CACHE_SIZE
+from metrics import ACTIVE_JOBS, JOBS, JOB_SECONDS, QUEUE_DEPTH, scrape_value, start_metrics_server
 import os
 import logging
 from typing import List, Dict
@@ -26,96 +30,195 @@ logger = logging.getLogger(__name__)
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 REDIS_QUEUE = 'minecraft_builder'
 
+# Pops up to ARGV[1] messages from the queue in one round trip
+DEQUEUE_SCRIPT = """
+local messages = {}
+for i = 1, tonumber(ARGV[1]) do
+    local message = redis.call('RPOP', KEYS[1])
+    if not message then
+        break
+    end
+    messages[i] = message
+end
+return messages
+"""
+
+# Seconds between pool health checks while no jobs are running
+POOL_MAINTENANCE_INTERVAL = 5
+
+
+def decode_job_message(msg) -> Dict:
+    """Turn a raw Celery message from the Redis queue into a build job"""
+    task = json.loads(msg)
+
+    # Decode the base64 encoded body
+    body_decoded = base64.b64decode(task['body']).decode('utf-8')
+    body = json.loads(body_decoded)
+
+    build_data = body[0][0] if body and body[0] else {}
+    return {
+        'id': task['headers']['id'],
+        'function_definition': build_data.get('function_definition'),
+        'metadata': build_data.get('metadata', {}),
+        'transport': build_data.get('transport'),
+        'bypass_cache': bool(build_data.get('bypass_cache', False))
+    }
+
+
 class MinecraftBuildService:
-    def __init__(self, batch_size: int = 1):
-        self.server_manager = MinecraftServerManager()
-        self.batch_size = batch_size
+    def __init__(self, worker_slots: int = 1, pool_min_size: int = 0, pool_max_size: int = 0,
+                 max_jobs_per_server: int = 10, plots_per_server: int = 1,
+                 server_manager: MinecraftServerManager = None):
+        self.server_manager = server_manager or MinecraftServerManager(
+            pool_min_size=pool_min_size,
+            pool_max_size=pool_max_size,
+            max_jobs_per_server=max_jobs_per_server,
+            plots_per_server=plots_per_server,
+            worker_slots=worker_slots
+        )
+        self.worker_slots = worker_slots
         self.is_running = False
         self.redis_client = Redis.from_url(REDIS_URL)
-        logger.info(f"MinecraftBuildService initialized with batch size: {batch_size}")
+        self.dequeue = self.redis_client.register_script(DEQUEUE_SCRIPT)
+        self.publisher = ResultPublisher()
+        self.result_cache = ResultCache(validate=self.structure_exists) if RESULT_CACHE_SIZE > 0 else None
+        self.build_settings = self.server_manager.build_settings()
+        QUEUE_DEPTH.set_function(scrape_value(lambda: self.redis_client.llen(REDIS_QUEUE)))
+        logger.info(f"MinecraftBuildService initialized with {worker_slots} worker slots")
 
-    def get_pending_jobs_from_redis(self) -> List[Dict]:
-        """Get pending jobs directly from Redis queue"""
-        logger.info("Checking for pending jobs in Redis")
-        jobs = []
-        
-        while len(jobs) < self.batch_size:
+    def get_pending_jobs_from_redis(self, max_jobs: int = 1) -> List[Dict]:
+        """Get up to max_jobs pending jobs from the Redis queue, waiting up to a second for the first"""
+        messages = self.dequeue(keys=[REDIS_QUEUE], args=[max_jobs])
+        if not messages:
             result = self.redis_client.brpop(REDIS_QUEUE, timeout=1)
             if result is None:
-                break
-            
+                return []
+            messages = [result[1]]
+            if max_jobs > 1:
+                messages += self.dequeue(keys=[REDIS_QUEUE], args=[max_jobs - 1])
+
+        jobs = []
+        for msg in messages:
             try:
-                _, msg = result
-                task = json.loads(msg)
-                logger.info(f"Found task: {task}")
-                
-                # Decode the base64 encoded body
-                body_decoded = base64.b64decode(task['body']).decode('utf-8')
-                body = json.loads(body_decoded)
-                
-                build_data = body[0][0] if body and body[0] else {}
-                jobs.append({
-                    'id': task['headers']['id'],
-                    'function_definition': build_data.get('function_definition'),
-                    'metadata': build_data.get('metadata', {})
-                })
+                job = decode_job_message(msg)
+                logger.info(f"Found task: {job['id']}")
+                jobs.append(job)
             except json.JSONDecodeError:
                 logger.error(f"Failed to decode message: {msg}")
             except Exception as e:
                 logger.error(f"Error processing Redis message: {str(e)}")
-        
+
         logger.info(f"Retrieved {len(jobs)} pending jobs from Redis")
         return jobs
 
-    async def process_batch(self, jobs: List[Dict]) -> List[Dict]:
-        """Process a batch of jobs concurrently"""
-        tasks = []
-        for job in jobs:
-            logger.info(f"Creating task for job: {job['id']}")
-            task = asyncio.create_task(
-                self.server_manager.process_build_job(
-                    job['id'],
-                    job['function_definition'],
-                    job['metadata']
-                )
-            )
-            tasks.append(task)
-        
-        logger.info(f"Processing batch of {len(tasks)} tasks")
+    def structure_exists(self, result):
+        """Whether the structure of a cached result is still in the structure store"""
+        digest = result.get('structure_digest')
+        return not digest or self.server_manager.structure_store.has_blob(digest)
+
+    async def run_job(self, job: Dict):
+        """Process one job in a worker slot"""
         start_time = time.time()
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        end_time = time.time()
-        logger.info(f"Batch processing completed in {end_time - start_time:.2f} seconds")
-        return results
+        ACTIVE_JOBS.inc()
+
+        def build():
+            return self.server_manager.process_build_job(
+                job['id'],
+                job['function_definition'],
+                job['metadata'],
+                transport=job.get('transport'),
+                on_stage=self.publisher.stage,
+                on_result=self.publisher.result
+            )
+
+        try:
+            if self.result_cache is None or job.get('bypass_cache'):
+                result = await build()
+            else:
+                key = build_key(job['function_definition'], self.build_settings)
+                result = await self.result_cache.run(key, build)
+                if result.get('cached'):
+                    # Served without this job's own build, which would have stored and published it
+                    result = dict(result, metadata=job['metadata'])
+                    if result.get('structure_digest'):
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, functools.partial(
+                                self.server_manager.structure_store.link, job['id'], result['structure_digest'],
+                                name=result.get('structure_name'), metadata=job['metadata'],
+                                dimensions=result.get('dimensions')))
+                    await self.publisher.result(job['id'], result)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            logger.debug(f"Traceback for job {job['id']}: {traceback.format_exc()}")
+            await self.publisher.result(job['id'], {'status': 'error', 'error': str(e)})
+            JOBS.labels('error').inc()
+            return None
+        finally:
+            ACTIVE_JOBS.dec()
+            JOB_SECONDS.observe(time.time() - start_time)
+        JOBS.labels(result.get('status', 'error')).inc()
+        logger.info(f"Job {job['id']} finished with status {result.get('status')} "
+                    f"in {time.time() - start_time:.2f} seconds")
+        return result
 
     async def run(self):
-        """Main service loop"""
+        """Main service loop: keep every worker slot busy, pulling a job as soon as one frees up"""
         self.is_running = True
-        logger.info(f"Starting build service with batch size {self.batch_size}")
+        logger.info(f"Starting build service with {self.worker_slots} worker slots")
 
-        while self.is_running:
-            try:
-                jobs = self.get_pending_jobs_from_redis()
-                
-                if not jobs:
-                    logger.info("No pending jobs, waiting for 5 seconds...")
-                    await asyncio.sleep(5)
+        loop = asyncio.get_running_loop()
+
+        if self.server_manager.pool_enabled:
+            logger.info("Warming up server pool")
+            await loop.run_in_executor(None, self.server_manager.fill_pool)
+
+        active = set()
+        fetch = None
+        last_maintenance = time.time()
+        try:
+            while self.is_running:
+                if fetch is None and len(active) < self.worker_slots:
+                    fetch = loop.run_in_executor(
+                        None, self.get_pending_jobs_from_redis, self.worker_slots - len(active))
+
+                done, _ = await asyncio.wait(active | {fetch} if fetch else active,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                active -= done
+                if fetch not in done:
                     continue
 
-                logger.info(f"Processing batch of {len(jobs)} jobs")
-                results = await self.process_batch(jobs)
-                
-                for job, result in zip(jobs, results):
-                    if isinstance(result, Exception):
-                        logger.error(f"Job {job['id']} failed: {str(result)}")
-                        logger.debug(f"Traceback for job {job['id']}: {traceback.format_exc()}")
-                    else:
-                        logger.info(f"Job {job['id']} completed successfully")
+                try:
+                    jobs = fetch.result()
+                except Exception as e:
+                    logger.error(f"Error in service loop: {str(e)}")
+                    logger.debug(f"Traceback: {traceback.format_exc()}")
+                    await asyncio.sleep(5)
+                    jobs = []
+                fetch = None
 
-            except Exception as e:
-                logger.error(f"Error in service loop: {str(e)}")
-                logger.debug(f"Traceback: {traceback.format_exc()}")
-                await asyncio.sleep(5)
+                for job in jobs:
+                    logger.info(f"Starting job {job['id']} ({len(active) + 1}/{self.worker_slots} slots busy)")
+                    active.add(asyncio.create_task(self.run_job(job)))
+
+                if (not active and self.server_manager.pool_enabled
+                        and time.time() - last_maintenance >= POOL_MAINTENANCE_INTERVAL):
+                    await loop.run_in_executor(None, self.server_manager.maintain_pool)
+                    last_maintenance = time.time()
+        finally:
+            if fetch is not None:
+                # Jobs the fetch already popped from the queue exist nowhere else, run them too
+                try:
+                    jobs = await fetch
+                except Exception as e:
+                    logger.error(f"Error fetching jobs while stopping: {str(e)}")
+                    jobs = []
+                for job in jobs:
+                    logger.info(f"Starting job {job['id']} fetched while stopping")
+                    active.add(asyncio.create_task(self.run_job(job)))
+            if active:
+                logger.info(f"Waiting for {len(active)} running jobs to finish")
+                await asyncio.gather(*active, return_exceptions=True)
+            await self.publisher.close()
 
     def stop(self):
         """Stop the service"""
@@ -133,8 +236,15 @@ def check_redis_connection():
 
 async def main():
     check_redis_connection()
-    batch_size = int(os.getenv('BUILD_BATCH_SIZE', '1'))
-    service = MinecraftBuildService(batch_size=batch_size)
+    start_metrics_server()
+    worker_slots = int(os.getenv('BUILD_WORKER_SLOTS', os.getenv('BUILD_BATCH_SIZE', '1')))
+    service = MinecraftBuildService(
+        worker_slots=worker_slots,
+        pool_min_size=int(os.getenv('MC_POOL_MIN_SIZE', '0')),
+        pool_max_size=int(os.getenv('MC_POOL_MAX_SIZE', '0')),
+        max_jobs_per_server=int(os.getenv('MC_POOL_MAX_JOBS_PER_SERVER', '10')),
+        plots_per_server=int(os.getenv('MC_PLOTS_PER_SERVER', '1'))
+    )
     
     logger.info(f"Redis URL: {REDIS_URL}")
     logger.info(f"Redis Queue: {REDIS_QUEUE}")
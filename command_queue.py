@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import uuid
+import logging
+from threading import Thread, Lock, Condition
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+from rcon_client import RconPool
+
+DELAY = int(os.getenv('DELAY', '1000'))  # Delay between chat commands to prevent spamming
+RCON_BATCH_SIZE = int(os.getenv('RCON_BATCH_SIZE', '256'))  # Commands sent per RCON batch
+ACK_TIMEOUT = float(os.getenv('ACK_TIMEOUT', '30'))  # Seconds the server may take to acknowledge a chat command
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '3600'))  # Seconds a build's queued commands may take to settle
+
+# Substrings of command feedback that mean the server rejected the command
+COMMAND_ERROR_MARKERS = ('Unknown or incomplete command', 'Incorrect argument', 'Could not set the block',
+                         'Too many blocks', 'That position is not loaded')
+
+
+class CommandError(Exception):
+    """A command the server rejected, or that was not acknowledged"""
+    pass
+
+
+def needs_player(command):
+    """WorldEdit commands (//pos1, //copy, ...) only work when sent by a player"""
+    return command.startswith('//')
+
+
+def gather(futures):
+    """Future of the results of ``futures`` in order, failing with the first error once all are done"""
+    futures = list(futures)
+    combined = Future()
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def settle(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        for future in futures:
+            if future.exception() is not None:
+                combined.set_exception(future.exception())
+                return
+        combined.set_result([future.result() for future in futures])
+
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(settle)
+    return combined
+
+
+class ChatTransport:
+    """Sends commands as chat messages from the bot, one at a time.
+
+    Every command is followed by a tellraw of a unique marker to the bot. Commands of one
+    player run in order, so the marker coming back means the command has run, and the
+    system messages received before it are the command's feedback.
+    """
+
+    batch_size = 1
+
+    def __init__(self, bot, backend, delay=DELAY, timeout=ACK_TIMEOUT):
+        self.bot = bot
+        self.backend = backend
+        self.delay = delay
+        self.timeout = timeout
+        self.markerPrefix = f"ack-{uuid.uuid4().hex[:8]}-"
+        self.sequence = 0
+        self.pendingMarker = None
+        self.feedback = []
+        self.condition = Condition()
+        self.logger = logging.getLogger(__name__ + '.ChatTransport')
+        # Registered through the bot backend, which passes the emitter first like every bot event;
+        # the same object is passed to off() when closing
+        self.listener = self.handleMessage
+        self.backend.on(self.bot, 'messagestr', self.listener)
+
+    def handleMessage(self, this, message, position=None, *args):
+        if position == 'chat':
+            return  # Player chat, not command feedback
+        with self.condition:
+            if self.pendingMarker is None:
+                return
+            if message == self.pendingMarker:
+                self.pendingMarker = None
+                self.condition.notify_all()
+            else:
+                self.feedback.append(message)
+
+    def send(self, commands):
+        responses = []
+        for command in commands:
+            self.sequence += 1
+            marker = f"{self.markerPrefix}{self.sequence}"
+            with self.condition:
+                self.pendingMarker = marker
+                self.feedback = []
+            self.bot.chat(command)
+            self.bot.chat(f"/tellraw @s {json.dumps({'text': marker})}")
+            with self.condition:
+                if not self.condition.wait_for(lambda: self.pendingMarker is None, self.timeout):
+                    self.pendingMarker = None
+                    raise CommandError(f'Command "{command}" was not acknowledged within {self.timeout}s')
+                response = '\n'.join(self.feedback)
+            if response:
+                self.logger.info(f"Command response: {response}")
+            responses.append(response)
+            if self.delay:
+                time.sleep(self.delay / 1000)
+        return responses
+
+    def close(self):
+        self.backend.off(self.bot, 'messagestr', self.listener)
+
+
+class LazyTransport:
+    """Creates its transport when the first command is sent through it.
+
+    Used for player transports, so a build whose commands never need a player does not
+    connect a bot at all.
+    """
+
+    batch_size = 1
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.transport = None
+        self.lock = Lock()
+
+    def send(self, commands):
+        with self.lock:
+            if self.transport is None:
+                self.transport = self.factory()
+        return self.transport.send(commands)
+
+    def close(self):
+        if self.transport is not None and hasattr(self.transport, 'close'):
+            self.transport.close()
+
+
+class RconTransport:
+    """Sends commands over one logged-in RCON connection, up to batch_size commands per batch.
+
+    A single connection keeps the commands in the order they were queued, so later
+    writes to the same block still win.
+    """
+
+    def __init__(self, host, port, password, batch_size=RCON_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.pool = RconPool(host, password, port, max_size=1)
+        self.logger = logging.getLogger(__name__ + '.RconTransport')
+
+    def send(self, commands):
+        # RCON takes commands without the leading slash; each reply is the command's feedback
+        return self.pool.command_many([command[1:] if command.startswith('/') else command
+                                       for command in commands])
+
+    def close(self):
+        self.pool.close()
+
+
+# Command queue system
+class CommandQueue:
+    """Queues build commands and sends them from a background thread.
+
+    Commands go through ``transport``; commands that need a player (WorldEdit) go through
+    ``player_transport`` instead, after everything queued before them has been sent.
+    With a ``rate`` (rate_control.AdaptiveRate) batches are paced at its rate and their
+    round trips are fed back to it.
+
+    ``add`` returns a Future that resolves to the command's feedback once the server has
+    acknowledged it, or fails with CommandError when the server rejected it. ``drained``
+    is a barrier: a Future that resolves once every command queued so far has settled.
+    Both are concurrent.futures Futures; wrap them with asyncio.wrap_future to await them.
+    """
+
+    def __init__(self, transport, player_transport=None, rate=None):
+        self.queue = deque()
+        self.isProcessing = False
+        self.transport = transport
+        self.player_transport = player_transport or transport
+        self.rate = rate
+        self.commandsSent = 0
+        self.commandsFailed = 0  # Rejected, unanswered or lost to a transport error
+        self.sendTime = 0.0
+        self.lastFuture = None
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__ + '.CommandQueue')
+
+    def add(self, command):
+        future = Future()
+        with self.lock:
+            self.queue.append((command, future))
+            self.lastFuture = future
+            self.logger.debug(f"Added command to queue: {command}")
+            if not self.isProcessing:
+                self.isProcessing = True
+                thread = Thread(target=self.processQueue)
+                thread.start()
+        return future
+
+    def addMany(self, commands):
+        """Queue several commands and return one Future of all their feedback"""
+        return gather([self.add(command) for command in commands])
+
+    def drained(self):
+        """Future that resolves once every command queued so far has been acknowledged or has failed"""
+        barrier = Future()
+        with self.lock:
+            last = self.lastFuture
+        if last is None:
+            barrier.set_result(None)
+        else:
+            # Commands settle in the order they were queued
+            last.add_done_callback(lambda _: barrier.set_result(None))
+        return barrier
+
+    def waitDrained(self, timeout=None):
+        try:
+            self.drained().result(timeout)
+        except TimeoutError:
+            raise CommandError(f"Queued commands did not settle within {timeout}s") from None
+
+    def _nextBatch(self):
+        """Pop the next run of commands that can go through the same transport"""
+        with self.lock:
+            if not self.queue:
+                self.isProcessing = False
+                return None, None
+            if needs_player(self.queue[0][0]):
+                return self.player_transport, [self.queue.popleft()]
+            batch = []
+            while self.queue and len(batch) < self.transport.batch_size and not needs_player(self.queue[0][0]):
+                batch.append(self.queue.popleft())
+            return self.transport, batch
+
+    def _settle(self, batch, responses):
+        for (command, future), response in zip(batch, responses):
+            if any(marker in response for marker in COMMAND_ERROR_MARKERS):
+                self.logger.warning(f'Command "{command}" was rejected: {response}')
+                future.set_exception(CommandError(f'Command "{command}" was rejected: {response}'))
+                self.commandsFailed += 1
+            else:
+                self.logger.debug(f'Executed command: {command}')
+                future.set_result(response)
+        for command, future in batch[len(responses):]:
+            # The transport answered fewer commands than it was given
+            self.logger.warning(f'Command "{command}" got no response')
+            future.set_exception(CommandError(f'Command "{command}" got no response'))
+            self.commandsFailed += 1
+
+    def processQueue(self):
+        self.logger.info("Started processing command queue")
+        while True:
+            transport, batch = self._nextBatch()
+            if batch is None:
+                break
+            if self.rate:
+                self.rate.wait(len(batch))
+            start = time.time()
+            try:
+                responses = transport.send([command for command, _ in batch])
+            except Exception as e:
+                self.logger.error(f'Error executing commands "{batch[0][0]}"..."{batch[-1][0]}": {e}')
+                error = e if isinstance(e, CommandError) else CommandError(str(e))
+                for _, future in batch:
+                    future.set_exception(error)
+                self.commandsFailed += len(batch)
+            else:
+                self._settle(batch, responses)
+            elapsed = time.time() - start
+            if self.rate:
+                self.rate.acknowledged(len(batch), elapsed)
+            self.sendTime += elapsed
+            self.commandsSent += len(batch)
+        self.logger.info(f"Finished processing command queue "
+                         f"({self.commandsSent} commands, {self.commandsPerSecond():.1f} commands/s)")
+
+    def close(self):
+        """Close the connections of the transports and rate control"""
+        for transport in {self.transport, self.player_transport}:
+            if hasattr(transport, 'close'):
+                transport.close()
+        if self.rate:
+            self.rate.close()
+
+    def commandsPerSecond(self):
+        if not self.sendTime:
+            return 0.0
+        return self.commandsSent / self.sendTime
+
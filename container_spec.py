@@ -0,0 +1,115 @@
+"""Turns the mc service of a compose template into Docker SDK container settings.
+
+Servers are created with a single ``client.containers.run(**container_settings(service))``
+call instead of writing a compose file and running docker-compose for every start and
+stop. Only the compose keys the server templates use are translated; relative bind
+mount sources are resolved against ``base_dir``, as compose resolves them against the
+directory of the compose file.
+"""
+import os
+import re
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ns|us|ms|h|m|s)')
+NANOSECONDS = {'ns': 1, 'us': 10 ** 3, 'ms': 10 ** 6, 's': 10 ** 9, 'm': 60 * 10 ** 9, 'h': 3600 * 10 ** 9}
+
+
+class ContainerSpecError(ValueError):
+    pass
+
+
+def parse_duration(value):
+    """A compose duration such as '1m30s' in nanoseconds, the unit of the Engine API"""
+    if isinstance(value, (int, float)):
+        return int(value * 10 ** 9)
+    parts = DURATION_PART.findall(value)
+    if not parts or ''.join(number + unit for number, unit in parts) != value.replace(' ', ''):
+        raise ContainerSpecError(f"Invalid duration: {value}")
+    return int(sum(float(number) * NANOSECONDS[unit] for number, unit in parts))
+
+
+def port_bindings(ports):
+    """'[ip:]host:container[/protocol]' entries as the ports argument of containers.run"""
+    bindings = {}
+    for entry in ports or []:
+        parts = str(entry).split(':')
+        container_port = parts[-1] if '/' in parts[-1] else f"{parts[-1]}/tcp"
+        if len(parts) == 1:
+            bindings[container_port] = None  # Random host port
+        elif len(parts) == 2:
+            bindings[container_port] = int(parts[0])
+        else:
+            bindings[container_port] = (':'.join(parts[:-2]), int(parts[-2]))
+    return bindings
+
+
+def volume_bindings(volumes, base_dir='.'):
+    """'source:target[:mode]' entries as the volumes argument of containers.run.
+
+    Sources that look like paths are bind mounts and made absolute, others are named volumes.
+    """
+    bindings = {}
+    for entry in volumes or []:
+        parts = entry.split(':')
+        if len(parts) == 1:
+            continue  # Anonymous volume, created from the image's VOLUME declarations anyway
+        source, target = parts[0], parts[1]
+        mode = parts[2] if len(parts) > 2 else 'rw'
+        if source.startswith(('.', '/', '~')):
+            source = os.path.abspath(os.path.join(base_dir, os.path.expanduser(source)))
+        bindings[source] = {'bind': target, 'mode': mode}
+    return bindings
+
+
+def environment_variables(environment):
+    """Compose environment (mapping or KEY=value list) as a dict of strings"""
+    if isinstance(environment, list):
+        environment = dict(entry.split('=', 1) if '=' in entry else (entry, '') for entry in environment)
+    return {name: '' if value is None else str(value) for name, value in (environment or {}).items()}
+
+
+def healthcheck(spec):
+    """Compose healthcheck as the healthcheck argument of containers.run"""
+    test = spec['test']
+    if isinstance(test, str):
+        test = ['CMD-SHELL', test]
+    settings = {'test': test}
+    for key, name in (('interval', 'interval'), ('timeout', 'timeout'), ('start_period', 'start_period')):
+        if key in spec:
+            settings[name] = parse_duration(spec[key])
+    if 'retries' in spec:
+        settings['retries'] = int(spec['retries'])
+    return settings
+
+
+def data_directory(settings):
+    """Host directory bind-mounted on /data by container settings, or None when /data is a volume"""
+    for source, binding in settings.get('volumes', {}).items():
+        if binding['bind'].rstrip('/') == '/data' and os.path.isabs(source):
+            return source
+    return None
+
+
+def container_settings(service, base_dir='.'):
+    """Keyword arguments of client.containers.run that start ``service`` detached"""
+    if 'image' not in service:
+        raise ContainerSpecError("Service has no image")
+    settings = {
+        'image': service['image'],
+        'environment': environment_variables(service.get('environment')),
+        'ports': port_bindings(service.get('ports')),
+        'volumes': volume_bindings(service.get('volumes'), base_dir),
+        'tty': bool(service.get('tty', False)),
+        'stdin_open': bool(service.get('stdin_open', False)),
+        'detach': True,
+    }
+    if 'container_name' in service:
+        settings['name'] = service['container_name']
+    restart = service.get('restart', 'no')
+    if restart != 'no':
+        name, _, retries = restart.partition(':')
+        settings['restart_policy'] = {'Name': name, 'MaximumRetryCount': int(retries or 0)}
+    if 'healthcheck' in service and not service['healthcheck'].get('disable'):
+        settings['healthcheck'] = healthcheck(service['healthcheck'])
+    if 'labels' in service:
+        settings['labels'] = environment_variables(service['labels'])
+    return settings
@@ -0,0 +1,74 @@
+import logging
+from array import array
+
+
+# Coordinate tracking system
+class CoordinateTracker:
+    """Tracks placed coordinates and their bounding box.
+
+    The bounding box is updated in O(1) per coordinate and coordinates are stored flat
+    (x, y, z, x, y, z, ...) in a typed array instead of one dict per block.
+    """
+
+    __slots__ = ('coordinates', 'minX', 'minY', 'minZ', 'maxX', 'maxY', 'maxZ', 'logger')
+
+    def __init__(self):
+        self.coordinates = array('i')
+        self.minX = self.minY = self.minZ = None
+        self.maxX = self.maxY = self.maxZ = None
+        self.logger = logging.getLogger(__name__ + '.CoordinateTracker')
+
+    def __len__(self):
+        return len(self.coordinates) // 3
+
+    def addCoordinate(self, x, y, z):
+        self.coordinates.extend((x, y, z))
+        if self.minX is None:
+            self.minX = self.maxX = x
+            self.minY = self.maxY = y
+            self.minZ = self.maxZ = z
+            return
+        if x < self.minX:
+            self.minX = x
+        elif x > self.maxX:
+            self.maxX = x
+        if y < self.minY:
+            self.minY = y
+        elif y > self.maxY:
+            self.maxY = y
+        if z < self.minZ:
+            self.minZ = z
+        elif z > self.maxZ:
+            self.maxZ = z
+
+    def addRegion(self, x1, y1, z1, x2, y2, z2):
+        """Track a cuboid; its two extreme corners determine its contribution to the bounding box"""
+        self.addCoordinate(min(x1, x2), min(y1, y2), min(z1, z2))
+        self.addCoordinate(max(x1, x2), max(y1, y2), max(z1, z2))
+
+    def getBoundingBox(self):
+        if self.minX is None:
+            return None
+        return {
+            'min': {
+                'x': self.minX,
+                'y': self.minY,
+                'z': self.minZ
+            },
+            'max': {
+                'x': self.maxX,
+                'y': self.maxY,
+                'z': self.maxZ
+            }
+        }
+
+    def getDimensions(self):
+        if self.minX is None:
+            return None
+        dimensions = {
+            'width': self.maxX - self.minX + 1,
+            'height': self.maxY - self.minY + 1,
+            'depth': self.maxZ - self.minZ + 1
+        }
+        self.logger.info(f"Structure dimensions: {dimensions}")
+        return dimensions
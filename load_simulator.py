@@ -0,0 +1,607 @@
+"""End-to-end load simulator for the build service.
+
+Runs the real MinecraftBuildService scheduler, MinecraftServerManager and mineflayer
+build code against in-process stand-ins instead of Docker and Minecraft:
+
+- FakeDockerClient replaces ``client.containers``. Containers it runs from the settings
+  container_spec renders print startup logs and then start a FakeMinecraftServer.
+- FakeMinecraftServer answers server list pings on the game port and speaks the real
+  RCON protocol on the RCON port, executing commands with a configurable latency.
+- FakeBotBackend replaces the Node mineflayer bots. Its bots send chat commands to the
+  fake server of the port they joined.
+
+Jobs are pushed to the Redis queue in the Celery message format and completion is read
+back from the build event stream, so the whole path from dequeue to published result is
+measured. Point REDIS_URL at a scratch Redis, since jobs go to the real queue name:
+
+    REDIS_URL=redis://localhost:6379/15 python load_simulator.py --jobs 1000 --slots 16 --pool-max 8
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import base64
+import socket
+import struct
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import docker
+import mineflayer
+from build_service import MinecraftBuildService, REDIS_QUEUE
+from server_manager import MinecraftServerManager
+from readiness import _pack_varint, _read_varint, _recv_exact
+from result_publisher import EVENT_STREAM
+from metrics import COMMANDS_FAILED
+
+logger = logging.getLogger(__name__)
+
+# Bytes vanilla's RCON thread reads per packet
+RCON_READ_SIZE = 1460
+
+
+class SimulationProfile:
+    """Latencies (seconds) and failure rates of the simulated backends.
+
+    Every latency is jittered by +/- ``jitter`` of its value.
+    """
+
+    def __init__(self, container_start=0.5, server_startup=3.0, bot_connect=0.05, bot_spawn=0.2,
+                 command_latency=0.0002, chat_latency=0.005, start_failure_rate=0.0,
+                 command_failure_rate=0.0, jitter=0.2, seed=None):
+        self.container_start = container_start
+        self.server_startup = server_startup
+        self.bot_connect = bot_connect
+        self.bot_spawn = bot_spawn
+        self.command_latency = command_latency
+        self.chat_latency = chat_latency
+        self.start_failure_rate = start_failure_rate
+        self.command_failure_rate = command_failure_rate
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self, base):
+        if base <= 0:
+            return 0.0
+        with self.lock:
+            return base * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def sleep(self, base):
+        time.sleep(self.delay(base))
+
+    def fails(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+
+class FakeMinecraftServer:
+    """Answers server list pings and RCON on real sockets; commands take command_latency each.
+
+    Like Paper, it reports tps and mspt, which rise with the rate commands are run at.
+    """
+
+    def __init__(self, profile, port, rcon_port, rcon_password):
+        self.profile = profile
+        self.port = port
+        self.rcon_port = rcon_port
+        self.rcon_password = rcon_password
+        self.commands_executed = 0
+        self.lock = threading.Lock()
+        # Commands per second, from which tick times are derived
+        self.window_start = time.monotonic()
+        self.window_commands = 0
+        self.command_rate = 0.0
+        self.sockets = []
+        self.running = False
+
+    def start(self):
+        self.running = True
+        for port, handler in ((self.port, self._handle_status), (self.rcon_port, self._handle_rcon)):
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(('127.0.0.1', port))
+            listener.listen(64)
+            self.sockets.append(listener)
+            threading.Thread(target=self._accept, args=(listener, handler), daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        for listener in self.sockets:
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            listener.close()
+        self.sockets = []
+
+    def _accept(self, listener, handler):
+        while self.running:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn, handler), daemon=True).start()
+
+    def _serve(self, conn, handler):
+        with conn:
+            try:
+                handler(conn)
+            except (ConnectionError, EOFError, OSError, struct.error):
+                pass
+
+    def mspt(self):
+        """Milliseconds per tick: a small base load plus command_latency for every command run in a tick"""
+        with self.lock:
+            elapsed = time.monotonic() - self.window_start
+            rate = max(self.command_rate, self.window_commands / elapsed if elapsed else 0.0)
+        return 2.0 + rate / 20 * self.profile.command_latency * 1000
+
+    def execute(self, command):
+        """Run a command the way the server would and return its feedback"""
+        self.profile.sleep(self.profile.command_latency)
+        with self.lock:
+            self.commands_executed += 1
+            self.window_commands += 1
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.command_rate = self.window_commands / (now - self.window_start)
+                self.window_start, self.window_commands = now, 0
+        name = command.split(' ', 1)[0].lstrip('/')
+        if name == 'tellraw':
+            # Chat acknowledgement markers always come back
+            return json.loads(command.split(' ', 2)[2])['text']
+        if self.profile.fails(self.profile.command_failure_rate):
+            return "Unknown or incomplete command, see below for error"
+        if name == 'list':
+            return "There are 0 of a max of 20 players online: "
+        if name == 'tps':
+            return f"§6TPS from last 1m, 5m, 15m: §a{min(20.0, 1000 / self.mspt()):.1f}, §a20.0, §a20.0"
+        if name == 'mspt':
+            mspt = self.mspt()
+            return (f"§6Server tick times §e(§7avg§e/§7min§e/§7max§e)§6 from last 5s§7,§6 10s§7,§6 1m§e:\n"
+                    f"§6◴ §a{mspt:.1f}§7/§a{mspt / 2:.1f}§7/§a{mspt * 2:.1f}")
+        return f"Executed {name}"
+
+    def _handle_status(self, conn):
+        _recv_exact(conn, _read_varint(conn))  # Handshake
+        _recv_exact(conn, _read_varint(conn))  # Status request
+        status = json.dumps({
+            'version': {'name': '1.20.4', 'protocol': 765},
+            'players': {'max': 20, 'online': 0},
+            'description': {'text': 'Simulated server'},
+        }).encode('utf-8')
+        payload = b'\x00' + _pack_varint(len(status)) + status
+        conn.sendall(_pack_varint(len(payload)) + payload)
+
+    def _handle_rcon(self, conn):
+        authenticated = False
+        while self.running:
+            # Like vanilla: one read of at most 1460 bytes must hold exactly one packet,
+            # anything else (e.g. pipelined packets) drops the connection
+            data = conn.recv(RCON_READ_SIZE)
+            if len(data) < 14 or struct.unpack('<i', data[:4])[0] != len(data) - 4:
+                if data:
+                    logger.warning(f"RCON read of {len(data)} bytes is not one packet, closing the connection")
+                return
+            request_id, packet_type = struct.unpack('<ii', data[4:12])
+            body = data[12:-2].decode('utf-8')
+            if packet_type == 3:  # Login
+                authenticated = body == self.rcon_password
+                self._send_rcon(conn, request_id if authenticated else -1, 2, '')
+            elif not authenticated:
+                return
+            elif packet_type == 2:  # Command
+                self._send_rcon(conn, request_id, 0, self.execute(body))
+            else:
+                # Vanilla answers unknown packet types, which clients use to find the end of a response
+                self._send_rcon(conn, request_id, 0, f"Unknown request {packet_type:x}")
+
+    @staticmethod
+    def _send_rcon(conn, request_id, packet_type, body):
+        # Long responses are split into 4096 character packets, like vanilla does
+        for start in range(0, max(len(body), 1), 4096):
+            payload = struct.pack('<ii', request_id, packet_type) + body[start:start + 4096].encode('utf-8') + b'\x00\x00'
+            conn.sendall(struct.pack('<i', len(payload)) + payload)
+
+
+class FakeLogStream:
+    """Iterator over a container's log lines that blocks for new lines until closed or stopped"""
+
+    def __init__(self, container):
+        self.container = container
+        self.position = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.container.condition:
+            while True:
+                if self.closed:
+                    raise StopIteration
+                if self.position < len(self.container.log_lines):
+                    self.position += 1
+                    return self.container.log_lines[self.position - 1]
+                if self.container.status != 'running':
+                    raise StopIteration
+                self.container.condition.wait()
+
+    def close(self):
+        with self.container.condition:
+            self.closed = True
+            self.container.condition.notify_all()
+
+
+class FakeContainer:
+    """A server container: prints startup logs, then runs a FakeMinecraftServer"""
+
+    def __init__(self, profile, collection, name, port, rcon_port, rcon_password):
+        self.profile = profile
+        self.collection = collection
+        self.name = name
+        self.port = port
+        self.rcon_port = rcon_port
+        self.rcon_password = rcon_password
+        self.status = 'running'
+        self.log_lines = [b"[Server thread/INFO]: Starting minecraft server version 1.20.4\n"]
+        self.condition = threading.Condition()
+        self.server = None
+        threading.Thread(target=self._boot, daemon=True).start()
+
+    def _log(self, line):
+        with self.condition:
+            self.log_lines.append(line.encode('utf-8') + b'\n')
+            self.condition.notify_all()
+
+    def _boot(self):
+        startup = self.profile.delay(self.profile.server_startup)
+        time.sleep(startup)
+        with self.condition:
+            if self.status != 'running':
+                return
+        if self.profile.fails(self.profile.start_failure_rate):
+            self._log("[Server thread/ERROR]: Encountered an unexpected exception")
+            self._log("[Server thread/ERROR]: This crash report has been saved to: crash-reports/simulated.txt")
+            self.stop(status='exited')
+            return
+        server = FakeMinecraftServer(self.profile, self.port, self.rcon_port, self.rcon_password)
+        try:
+            server.start()
+        except OSError as e:
+            self._log(f"[Server thread/WARN]: **** FAILED TO BIND TO PORT! {e}")
+            self.stop(status='exited')
+            return
+        self.server = server
+        self._log(f'[Server thread/INFO]: Done ({startup:.3f}s)! For help, type "help"')
+
+    def logs(self, stream=False, follow=False, **kwargs):
+        if stream:
+            return FakeLogStream(self)
+        with self.condition:
+            return b''.join(self.log_lines)
+
+    def reload(self):
+        pass
+
+    def exec_run(self, cmd, demux=False, **kwargs):
+        # Nothing exists inside a simulated container, e.g. WorldEdit schematics
+        return (1, (b'', b'')) if demux else (1, b'')
+
+    def get_archive(self, path, **kwargs):
+        raise docker.errors.NotFound(f"Could not find the file {path} in container {self.name}")
+
+    def stop(self, status='exited'):
+        with self.condition:
+            self.status = status
+            self.condition.notify_all()
+        if self.server:
+            self.server.stop()
+
+    def remove(self, force=False, v=False):
+        with self.collection.lock:
+            self.collection.containers.pop(self.name, None)
+        self.stop()
+
+
+class FakeContainerCollection:
+    def __init__(self, profile):
+        self.profile = profile
+        self.containers = {}
+        self.started = 0
+        self.lock = threading.Lock()
+
+    def run(self, image, name=None, ports=None, environment=None, detach=False, **kwargs):
+        self.profile.sleep(self.profile.container_start)
+        name = name or f"fake-{uuid.uuid4().hex[:8]}"
+        with self.lock:
+            if name in self.containers:
+                raise docker.errors.APIError(f"Conflict. The container name \"/{name}\" is already in use")
+        container = FakeContainer(self.profile, self, name, ports['25565/tcp'], ports['25575/tcp'],
+                                  environment['RCON_PASSWORD'])
+        with self.lock:
+            self.containers[name] = container
+            self.started += 1
+        return container
+
+    def get(self, name):
+        with self.lock:
+            container = self.containers.get(name)
+        if container is None:
+            raise docker.errors.NotFound(f"No such container: {name}")
+        return container
+
+    def list(self, filters=None, **kwargs):
+        name = (filters or {}).get('name')
+        with self.lock:
+            return [container for container_name, container in self.containers.items()
+                    if name is None or name in container_name]
+
+
+class FakeDockerClient:
+    """Stands in for docker.from_env()"""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.containers = FakeContainerCollection(profile)
+
+    @property
+    def servers_started(self):
+        return self.containers.started
+
+    def server_on_port(self, port):
+        with self.containers.lock:
+            containers = list(self.containers.containers.values())
+        for container in containers:
+            if container.server and container.server.port == port:
+                return container.server
+        return None
+
+    def commands_executed(self):
+        with self.containers.lock:
+            containers = list(self.containers.containers.values())
+        return sum(container.server.commands_executed for container in containers if container.server)
+
+
+class FakeBot:
+    """A joined player whose chat commands run on the fake server"""
+
+    def __init__(self, profile, server, username):
+        self.profile = profile
+        self.server = server
+        self.username = username
+        self.listeners = {}
+
+    def on(self, event, handler):
+        self.listeners.setdefault(event, []).append(handler)
+
+    def remove_listener(self, event, handler):
+        if handler in self.listeners.get(event, []):
+            self.listeners[event].remove(handler)
+
+    def chat(self, message):
+        self.profile.sleep(self.profile.chat_latency)
+        if not message.startswith('/'):
+            return
+        response = self.server.execute(message[1:])
+        # Command feedback reaches the player as system messages; like the javascript bridge,
+        # handlers get the emitting bot first
+        for handler in list(self.listeners.get('messagestr', [])):
+            handler(self, response, 'system')
+
+    def quit(self):
+        self.listeners.clear()
+
+
+class FakeBotBackend:
+    """Implements MineflayerBackend's methods with FakeBots"""
+
+    def __init__(self, docker_client, profile):
+        self.docker_client = docker_client
+        self.profile = profile
+
+    def createBot(self, options):
+        self.profile.sleep(self.profile.bot_connect)
+        server = self.docker_client.server_on_port(options['port'])
+        if server is None:
+            raise ConnectionRefusedError(f"Nothing is listening on port {options['port']}")
+        return FakeBot(self.profile, server, options['username'])
+
+    def on(self, bot, event, handler):
+        bot.on(event, handler)
+
+    def off(self, bot, event, handler):
+        bot.remove_listener(event, handler)
+
+    def once(self, bot, event):
+        if event == 'spawn':
+            self.profile.sleep(self.profile.bot_spawn)
+
+
+class SimulatedServerManager(MinecraftServerManager):
+    """MinecraftServerManager whose Docker client is simulated"""
+
+    def __init__(self, profile, **kwargs):
+        super().__init__(docker_client=FakeDockerClient(profile), **kwargs)
+
+
+def synthetic_job(size, transport, bypass_cache=True):
+    """A Celery message for a solid cube build of about ``size`` blocks.
+
+    Every synthetic build is identical, so they bypass the result cache unless told otherwise.
+    """
+    side = max(1, round(size ** (1 / 3)))
+    function_definition = (
+        f"for y in range({side}):\n"
+        f"    for z in range({side}):\n"
+        f"        for x in range({side}):\n"
+        f"            safeSetBlock(x, y, z, 'stone' if (x + y + z) % 2 else 'oak_planks')\n"
+    )
+    task_id = str(uuid.uuid4())
+    body = [[{'function_definition': function_definition, 'metadata': {'name': f'Load test {task_id[:8]}'},
+              'transport': transport, 'bypass_cache': bypass_cache}], {}, {'callbacks': None, 'errbacks': None, 'chain': None, 'chord': None}]
+    message = json.dumps({
+        'body': base64.b64encode(json.dumps(body).encode('utf-8')).decode('ascii'),
+        'content-encoding': 'utf-8',
+        'content-type': 'application/json',
+        'headers': {'lang': 'py', 'task': 'minecraft_builder.build_structure', 'id': task_id},
+        'properties': {'delivery_mode': 2, 'priority': 0, 'body_encoding': 'base64'},
+    })
+    return task_id, message
+
+
+def counter_total(counter):
+    return sum(sample.value for metric in counter.collect() for sample in metric.samples
+               if sample.name.endswith('_total'))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def submit_jobs(redis_client, jobs, rate, submitted):
+    """Push jobs onto the queue, all at once or ``rate`` per second"""
+    interval = 1 / rate if rate else 0
+    for task_id, message in jobs:
+        submitted[task_id] = time.time()
+        redis_client.lpush(REDIS_QUEUE, message)
+        if interval:
+            time.sleep(interval)
+
+
+def wait_for_results(redis_client, last_id, submitted, total, timeout):
+    """Read completion events until every job has finished; returns task_id -> (status, latency)"""
+    finished = {}
+    deadline = time.time() + timeout
+    while len(finished) < total and time.time() < deadline:
+        entries = redis_client.xread({EVENT_STREAM: last_id}, count=1000, block=1000)
+        for _, events in entries or []:
+            for event_id, fields in events:
+                last_id = event_id
+                task_id = fields[b'task_id'].decode()
+                state = fields[b'state'].decode()
+                if task_id in submitted and state in ('SUCCESS', 'FAILURE') and task_id not in finished:
+                    finished[task_id] = (state, time.time() - submitted[task_id])
+        if finished and len(finished) % 100 == 0:
+            logger.info(f"{len(finished)}/{total} jobs finished")
+    return finished
+
+
+async def run_simulation(args):
+    profile = SimulationProfile(
+        container_start=args.container_start,
+        server_startup=args.server_startup,
+        bot_spawn=args.bot_spawn,
+        command_latency=args.command_latency,
+        chat_latency=args.chat_latency,
+        start_failure_rate=args.start_failure_rate,
+        command_failure_rate=args.command_failure_rate,
+        seed=args.seed,
+    )
+    manager = SimulatedServerManager(
+        profile,
+        pool_min_size=args.pool_min,
+        pool_max_size=args.pool_max,
+        max_jobs_per_server=args.max_jobs_per_server,
+        plots_per_server=args.plots,
+        worker_slots=args.slots,
+    )
+    mineflayer.setBotBackend(FakeBotBackend(manager.client, profile))
+    service = MinecraftBuildService(worker_slots=args.slots, server_manager=manager)
+    redis_client = service.redis_client
+
+    newest = redis_client.xrevrange(EVENT_STREAM, count=1)
+    last_id = newest[0][0] if newest else '0-0'
+    jobs = [synthetic_job(args.blocks, args.transport, not args.cache) for _ in range(args.jobs)]
+    submitted = {}
+
+    loop = asyncio.get_running_loop()
+    failed_commands = counter_total(COMMANDS_FAILED)
+    start = time.time()
+    service_task = asyncio.create_task(service.run())
+    submitter = loop.run_in_executor(None, submit_jobs, redis_client, jobs, args.rate, submitted)
+    results = await loop.run_in_executor(None, wait_for_results, redis_client, last_id, submitted,
+                                         len(jobs), args.timeout)
+    elapsed = time.time() - start
+    await submitter
+
+    service.stop()
+    await service_task
+    await loop.run_in_executor(None, manager.stop_all_servers)
+
+    latencies = [latency for _, latency in results.values()]
+    report = {
+        'jobs': len(jobs),
+        'finished': len(results),
+        'succeeded': sum(state == 'SUCCESS' for state, _ in results.values()),
+        'failed': sum(state == 'FAILURE' for state, _ in results.values()),
+        # Commands of successful builds the servers rejected, leaving those builds incomplete
+        'commands_failed': counter_total(COMMANDS_FAILED) - failed_commands,
+        'elapsed': elapsed,
+        'jobs_per_second': len(results) / elapsed if elapsed else 0.0,
+        'latency': {name: percentile(latencies, fraction) for name, fraction in
+                    (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))},
+        'servers_started': manager.client.servers_started,
+        'settings': vars(args),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the build service against simulated servers")
+    parser.add_argument('--jobs', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=0, help='jobs submitted per second, 0 submits all at once')
+    parser.add_argument('--blocks', type=int, default=1000, help='blocks per synthetic build')
+    parser.add_argument('--transport', choices=('rcon', 'chat'), default='rcon')
+    parser.add_argument('--slots', type=int, default=8, help='worker slots of the build service')
+    parser.add_argument('--pool-min', type=int, default=0)
+    parser.add_argument('--pool-max', type=int, default=0, help='pooled servers, 0 starts a server per job')
+    parser.add_argument('--max-jobs-per-server', type=int, default=10)
+    parser.add_argument('--plots', type=int, default=1, help='plots per pooled server')
+    parser.add_argument('--container-start', type=float, default=0.5)
+    parser.add_argument('--server-startup', type=float, default=3.0)
+    parser.add_argument('--bot-spawn', type=float, default=0.2)
+    parser.add_argument('--command-latency', type=float, default=0.0002)
+    parser.add_argument('--chat-latency', type=float, default=0.005)
+    parser.add_argument('--start-failure-rate', type=float, default=0.0)
+    parser.add_argument('--command-failure-rate', type=float, default=0.0)
+    parser.add_argument('--cache', action='store_true',
+                        help='let the identical synthetic builds be served by the result cache')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--timeout', type=float, default=3600, help='seconds to wait for all jobs')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    # Port leases and exported structures of the run stay out of the checkout
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    work_dir = tempfile.mkdtemp(prefix='mc-load-')
+    shutil.copy(os.path.join(repo_dir, 'base-compose.yml'), work_dir)
+    os.chdir(work_dir)
+    logger.info(f"Simulating in {work_dir}")
+
+    try:
+        report = asyncio.run(run_simulation(args))
+    finally:
+        os.chdir(repo_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['finished'] < report['jobs']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Port of the Prometheus metrics endpoint, 0 disables it
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# Stages range from milliseconds (RCON round trips) to minutes (server start, large builds)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    'build_stage_seconds', 'Time spent in each stage of a build job', ['stage'], buckets=STAGE_BUCKETS)
+STAGE_FAILURES = Counter(
+    'build_stage_failures_total', 'Build jobs that failed, by the stage they failed in', ['stage'])
+JOB_SECONDS = Histogram(
+    'build_job_seconds', 'Total time of a build job, from dequeue to result', buckets=STAGE_BUCKETS)
+JOBS = Counter('build_jobs_total', 'Finished build jobs, by result status', ['status'])
+ACTIVE_JOBS = Gauge('build_active_jobs', 'Build jobs currently running')
+COMMANDS_SENT = Counter('build_commands_sent_total', 'Block commands sent to servers')
+COMMANDS_FAILED = Counter('build_commands_failed_total', 'Commands the server rejected or did not acknowledge')
+COMMANDS_PER_SECOND = Histogram(
+    'build_commands_per_second', 'Command throughput of a build',
+    buckets=(1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000))
+QUEUE_DEPTH = Gauge('build_queue_depth', 'Jobs waiting in the Redis queue')
+SERVERS = Gauge('build_servers', 'Minecraft servers, by kind', ['kind'])
+CACHE_LOOKUPS = Counter(
+    'build_cache_lookups_total', 'Result cache lookups, by whether they hit, joined a running build or missed',
+    ['result'])
+
+
+@contextmanager
+def stage_timer(stage):
+    """Observe the duration of a stage, counting it as the failed stage if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_FAILURES.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def observe_build(result):
+    """Record the stage timings and command throughput reported by a mineflayer build"""
+    for stage, seconds in result.get('timings', {}).items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    if result.get('status') != 'success':
+        STAGE_FAILURES.labels(result.get('stage', 'build')).inc()
+        return
+    COMMANDS_SENT.inc(result.get('commands_sent', 0))
+    COMMANDS_FAILED.inc(result.get('commands_failed', 0))
+    if result.get('commands_per_second'):
+        COMMANDS_PER_SECOND.observe(result['commands_per_second'])
+
+
+def scrape_value(func):
+    """Wrap a callback for Gauge.set_function so a failing source reports NaN instead of breaking the scrape"""
+    def value():
+        try:
+            return func()
+        except Exception as e:
+            logger.debug(f"Metric source failed: {e}")
+            return float('nan')
+    return value
+
+
+def start_metrics_server(port=METRICS_PORT):
+    if port:
+        start_http_server(port)
+        logger.info(f"Serving Prometheus metrics on port {port}")
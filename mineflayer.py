@@ -1,12 +1,17 @@
 import time
+import uuid
 import logging
-from javascript import require, On, Once, AsyncTask, once, off
 import os
-from threading import Thread
-
-mineflayer = require('mineflayer')
-Vec3 = require('vec3').Vec3
-Buffer = require('buffer').Buffer or bot._global.Buffer
+from command_queue import CommandQueue, ChatTransport, RconTransport, LazyTransport, DELAY, DRAIN_TIMEOUT
+from rate_control import AdaptiveRate, ServerHealthProbe, RATE_CONTROL, CHAT_RATE_MAX
+from build_commands import setblock_command, fill_command, worldedit_save_commands
+from placement_optimizer import PlacementBuffer, MAX_FILL_VOLUME
+from coordinate_tracker import CoordinateTracker
+from build_recorder import BuildRecorder
+from schematic import DATA_VERSIONS, schematic_from_grid, write_schematic
+from voxel_simulator import simulate_operations, SimulationTooLarge
+from build_sandbox import BuildSandbox
+from structure_store import STRUCTURE_STORE_PATH
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -17,14 +22,173 @@ HOST = os.getenv('HOST', '127.0.0.1')
 PORT = int(os.getenv('PORT', '25565'))
 VERSION = os.getenv('VERSION', '1.20.4')
 USERNAME = os.getenv('USERNAME', 'builder')
-DELAY = int(os.getenv('DELAY', '1000'))  # Increased delay to prevent spamming
-STRUCTURE_NAME = os.getenv('STRUCTURE_NAME', f'structure_{time.strftime("%Y-%m-%dT%H-%M-%S")}')
+TRANSPORT = os.getenv('BUILD_TRANSPORT', 'chat')  # 'chat' (bot) or 'rcon'
+COALESCE_BLOCKS = os.getenv('COALESCE_BLOCKS', 'true').lower() == 'true'  # Merge setblocks into fills
+SCHEMATIC_EXPORT = os.getenv('SCHEMATIC_EXPORT', 'native')  # 'native' or 'worldedit'
+SCHEMATIC_VERSION = int(os.getenv('SCHEMATIC_VERSION', '3'))  # Sponge schematic version (2 or 3)
+STRUCTURE_NAME = os.getenv('STRUCTURE_NAME')  # Same name for every build, unique per build when unset
 
-def build_structure(function_definition, metadata=None):
-    """Build a structure from a function definition"""
-    try:
-        global bot, commandQueue, coordinateTracker
+class MineflayerBackend:
+    """Creates bots with the Node mineflayer library through the javascript bridge"""
+
+    def __init__(self):
+        global mineflayer, Vec3, Buffer
+        # Imported on first use so this module loads without Node, e.g. under load_simulator
+        from javascript import require, On, off, once
+        self._On = On
+        self._off = off
+        self._once = once
+        mineflayer = require('mineflayer')
+        Vec3 = require('vec3').Vec3
+        Buffer = require('buffer').Buffer
+
+    def createBot(self, options):
+        return mineflayer.createBot(options)
+
+    def on(self, bot, event, handler):
+        self._On(bot, event)(handler)
+
+    def off(self, bot, event, handler):
+        self._off(bot, event, handler)
+
+    def once(self, bot, event):
+        return self._once(bot, event)
+
+botBackend = None
+
+def setBotBackend(backend):
+    """Replace the mineflayer bots with another implementation of MineflayerBackend's methods"""
+    global botBackend
+    botBackend = backend
+
+def getBotBackend():
+    global botBackend
+    if botBackend is None:
+        botBackend = MineflayerBackend()
+    return botBackend
+
+buildSandbox = None
+
+def getBuildSandbox():
+    """Sandbox for build_structure calls that pass a function definition instead of operations"""
+    global buildSandbox
+    if buildSandbox is None:
+        buildSandbox = BuildSandbox()
+    return buildSandbox
+
+class BuildContext:
+    """Everything one build sends commands through and records into.
+
+    Each build_structure call gets its own context, so builds on different plots can run
+    in parallel threads. Coordinates passed in are local to the build; ``origin`` is added
+    before commands are sent and bounds are tracked.
+    """
+
+    def __init__(self, commandQueue, origin=None, coalesce=COALESCE_BLOCKS):
+        self.commandQueue = commandQueue
+        self.origin = tuple(origin or (0, 0, 0))
+        self.coordinateTracker = CoordinateTracker()
+        self.buildRecorder = BuildRecorder()
+        self.placementBuffer = PlacementBuffer(commandQueue.add, MAX_FILL_VOLUME) if coalesce else None
+
+    def setBlock(self, x, y, z, block, mode=None):
+        # World coordinates inside the job's plot
+        ox, oy, oz = self.origin
+        wx, wy, wz = x + ox, y + oy, z + oz
+
+        if self.placementBuffer and mode in (None, 'replace'):
+            # Plain placements are merged into fill commands
+            self.placementBuffer.set_block(wx, wy, wz, block)
+        else:
+            self.flush()
+            self.commandQueue.add(setblock_command(wx, wy, wz, block, mode))
+        self.coordinateTracker.addCoordinate(wx, wy, wz)
+        self.buildRecorder.set_block(x, y, z, block, mode)
+
+    def fill(self, x1, y1, z1, x2, y2, z2, block, mode=None, replaceFilter=None):
+        ox, oy, oz = self.origin
+        # Buffered placements before this fill must land first
+        self.flush()
+        self.commandQueue.add(fill_command(x1 + ox, y1 + oy, z1 + oz, x2 + ox, y2 + oy, z2 + oz, block,
+                                           mode, replaceFilter))
+        self.coordinateTracker.addRegion(x1 + ox, y1 + oy, z1 + oz, x2 + ox, y2 + oy, z2 + oz)
+        self.buildRecorder.fill(x1, y1, z1, x2, y2, z2, block, mode, replaceFilter)
+
+    def replay(self, operations):
+        """Send the operations recorded by a sandboxed build function, in order"""
+        for operation in operations:
+            if operation[0] == 'setblock':
+                self.setBlock(*operation[1:])
+            else:
+                self.fill(*operation[1:])
+        self.flush()
+
+    def flush(self):
+        if self.placementBuffer:
+            self.placementBuffer.flush()
+
+    def saveStructure(self, name):
+        logger = logging.getLogger(__name__ + '.saveStructure')
+        self.flush()
+        boundingBox = self.coordinateTracker.getBoundingBox()
+        if not boundingBox:
+            logger.warning('No blocks placed yet to create structure')
+            return
+
+        # Use WorldEdit commands to select, copy and save the region
+        for command in worldedit_save_commands(boundingBox, name):
+            self.commandQueue.add(command)
+
+        logger.info(f"Structure saved: {name} from {boundingBox['min']} to {boundingBox['max']}")
+
+    def exportSchematic(self, name):
+        """Write the recorded build to <STRUCTURE_STORE_PATH>/<name>.schem without going through WorldEdit"""
+        logger = logging.getLogger(__name__ + '.exportSchematic')
+        os.makedirs(STRUCTURE_STORE_PATH, exist_ok=True)
+        path = os.path.join(STRUCTURE_STORE_PATH, f"{name}.schem")
+        start = time.time()
+        structure = simulate_operations(self.buildRecorder.operations)
+        nbt = schematic_from_grid(structure['blocks'], structure['palette'], SCHEMATIC_VERSION,
+                                  DATA_VERSIONS.get(VERSION, DATA_VERSIONS['1.20.4']))
+        write_schematic(path, nbt)
+        logger.info(f"Structure exported to {path} ({structure['block_count']} blocks in {time.time() - start:.3f}s)")
+        return path
+
+def build_structure(function_definition=None, metadata=None, host=None, port=None, transport=None,
+                    rcon_port=None, rcon_password=None, username=None, origin=None, operations=None,
+                    structure_name=None):
+    """Build a structure from a function definition, or from the operations it recorded.
+
+    The function definition never runs in this process: it is run in a BuildSandbox
+    worker first, unless the caller already did that and passes its ``operations``.
+    The operations are then replayed through a per-build BuildContext.
+
+    Block commands are sent through the bot's chat ('chat' transport) or over
+    RCON ('rcon' transport, needs rcon_port and rcon_password). WorldEdit commands always
+    go through the bot; with RCON the bot only joins once such a command is queued.
+
+    On a server shared by several jobs, ``username`` names this job's bot and ``origin``
+    is the (x, y, z) offset of its plot, added to every coordinate the build places.
+    The structure is saved as ``structure_name``, a new unique name by default.
+
+    The result reports the seconds spent in each stage under 'timings', and the stage a
+    failed build stopped in under 'stage'.
+    """
+    transport = transport or TRANSPORT
+    timings = {}
+    firstStage = 'bot_connect' if transport == 'chat' else 'replay'
+    stage = 'sandbox' if operations is None else firstStage
+    stageStart = time.perf_counter()
+    bot = None
+    commandQueue = None
+
+    def nextStage(name):
+        nonlocal stage, stageStart
+        now = time.perf_counter()
+        timings[stage] = now - stageStart
+        stage, stageStart = name, now
 
+    try:
         logger.info("Starting build_structure function")
         
         # Log metadata if provided
@@ -33,299 +197,164 @@ def build_structure(function_definition, metadata=None):
             logger.info(f"Author: {metadata.get('author', 'Unknown')}")
             logger.info(f"Description: {metadata.get('description', 'No description')}")
 
-        BOT_USERNAME = 'Builder'
-
-        # Add retry logic for bot connection
-        max_retries = 3
-        retry_delay = 5
-        last_error = None
-
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Attempting to connect bot (attempt {attempt + 1}/{max_retries})")
-                bot = mineflayer.createBot({
-                    'host': HOST,
-                    'port': PORT,
-                    'username': BOT_USERNAME,
-                    'version': VERSION,
-                    'hideErrors': False,
-                    'connectTimeout': 30000,  # 30 seconds timeout
-                })
-                logger.info("Bot connection successful")
-                break
-            except Exception as e:
-                last_error = e
-                logger.error(f"Connection attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
-                    logger.info(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                else:
-                    raise Exception(f"Failed to connect after {max_retries} attempts: {last_error}")
-
-        commandQueue = CommandQueue()
-        coordinateTracker = CoordinateTracker()
-
-        # Set up event handlers
-        @On(bot, 'kicked')
-        def on_kicked(this, reason, logged_in):
-            logger.warning(f'Bot was kicked! Reason: {reason}')
-
-        @On(bot, 'error')
-        def on_error(this, err):
-            logger.error(f'Bot encountered an error: {err}')
-
-        # Wait for spawn with timeout
-        logger.info('Waiting for login...')
-        spawn_timeout = 30  # 30 seconds timeout
-        spawn_start = time.time()
-        while time.time() - spawn_start < spawn_timeout:
-            try:
-                once(bot, 'spawn')
-                logger.info('Bot spawned successfully')
-                break
-            except Exception as e:
-                if time.time() - spawn_start >= spawn_timeout:
-                    raise Exception(f"Bot spawn timeout after {spawn_timeout} seconds")
-                time.sleep(1)
-
-        # Short delay for spawn
-        time.sleep(1)
-
-        # Execute the build
-        logger.info("Starting build execution")
-        buildCreation(function_definition)
+        if operations is None:
+            operations = getBuildSandbox().run(function_definition)
+            nextStage(firstStage)
+
+        def joinBot(trackStages=False):
+            """Connect the build's bot and wait until it has spawned"""
+            nonlocal bot
+            backend = getBotBackend()
+            BOT_USERNAME = username or 'Builder'
+
+            # Add retry logic for bot connection
+            max_retries = 3
+            retry_delay = 5
+            last_error = None
+
+            for attempt in range(max_retries):
+                try:
+                    logger.info(f"Attempting to connect bot (attempt {attempt + 1}/{max_retries})")
+                    bot = backend.createBot({
+                        'host': host or HOST,
+                        'port': port or PORT,
+                        'username': BOT_USERNAME,
+                        'version': VERSION,
+                        'hideErrors': False,
+                        'connectTimeout': 30000,  # 30 seconds timeout
+                    })
+                    logger.info("Bot connection successful")
+                    break
+                except Exception as e:
+                    last_error = e
+                    logger.error(f"Connection attempt {attempt + 1} failed: {e}")
+                    if attempt < max_retries - 1:
+                        logger.info(f"Retrying in {retry_delay} seconds...")
+                        time.sleep(retry_delay)
+                    else:
+                        raise Exception(f"Failed to connect after {max_retries} attempts: {last_error}")
+
+            # Set up event handlers
+            def on_kicked(this, reason, logged_in):
+                logger.warning(f'Bot was kicked! Reason: {reason}')
+
+            def on_error(this, err):
+                logger.error(f'Bot encountered an error: {err}')
+
+            backend.on(bot, 'kicked', on_kicked)
+            backend.on(bot, 'error', on_error)
+
+            # Wait for spawn with timeout
+            if trackStages:
+                nextStage('bot_spawn')
+            logger.info('Waiting for login...')
+            spawn_timeout = 30  # 30 seconds timeout
+            spawn_start = time.time()
+            while time.time() - spawn_start < spawn_timeout:
+                try:
+                    backend.once(bot, 'spawn')
+                    logger.info('Bot spawned successfully')
+                    break
+                except Exception as e:
+                    if time.time() - spawn_start >= spawn_timeout:
+                        raise Exception(f"Bot spawn timeout after {spawn_timeout} seconds")
+                    time.sleep(1)
+
+            # Short delay for spawn
+            if trackStages:
+                nextStage('stabilize')
+            time.sleep(1)
+            return bot
+
+        # The send rate follows the server's tick health, probed over RCON when it is available
+        probe = ServerHealthProbe(host or HOST, rcon_port, rcon_password) if RATE_CONTROL and rcon_port else None
+        if transport == 'rcon':
+            logger.info("Sending block commands over RCON")
+            # Only WorldEdit commands need the bot, e.g. a WorldEdit save instead of a native export
+            commandQueue = CommandQueue(RconTransport(host or HOST, rcon_port, rcon_password),
+                                        player_transport=LazyTransport(lambda: ChatTransport(joinBot(), getBotBackend())),
+                                        rate=AdaptiveRate.for_rcon(probe) if RATE_CONTROL else None)
+        elif transport == 'chat':
+            joinBot(trackStages=True)
+            if RATE_CONTROL:
+                # DELAY=0 disables the fixed delay, so start at the fastest rate
+                initial = 1000 / DELAY if DELAY else CHAT_RATE_MAX
+                commandQueue = CommandQueue(ChatTransport(bot, getBotBackend(), delay=0),
+                                            rate=AdaptiveRate.for_chat(probe, initial=initial))
+            else:
+                commandQueue = CommandQueue(ChatTransport(bot, getBotBackend()))
+        else:
+            raise ValueError(f"Invalid transport: {transport}. Must be one of: chat, rcon")
+        context = BuildContext(commandQueue, origin)
+
+        # Send the recorded build
+        nextStage('replay')
+        logger.info(f"Replaying {len(operations)} build operations")
+        context.replay(operations)
         
         # Wait for commands to complete
-        logger.info("Waiting for build commands to complete")
-        while commandQueue.isProcessing:
-            time.sleep(0.5)
+        nextStage('queue_drain')
+        logger.info("Waiting for the server to acknowledge the build commands")
+        commandQueue.waitDrained(DRAIN_TIMEOUT)
 
         # Save structure
-        structure_name = STRUCTURE_NAME
-        logger.info(f"Saving structure as: {structure_name}")
-        saveStructure(structure_name)
-
-        # Wait for commands to complete
-        logger.info("Waiting for all commands to complete")
-        while commandQueue.isProcessing:
-            time.sleep(0.5)
-        
-        # Wait for commands to complete
-        time.sleep(1)
+        nextStage('schematic_export')
+        structure_name = structure_name or STRUCTURE_NAME or \
+            f'structure_{time.strftime("%Y-%m-%dT%H-%M-%S")}_{uuid.uuid4().hex[:8]}'
+        structure_file = None
+        if SCHEMATIC_EXPORT == 'native':
+            try:
+                structure_file = context.exportSchematic(structure_name)
+            except SimulationTooLarge as e:
+                # Too spread out for an in-memory grid, WorldEdit saves it from the world instead
+                logger.info(f"{e}, saving the structure with WorldEdit")
+        if structure_file is None:
+            logger.info(f"Saving structure as: {structure_name}")
+            context.saveStructure(structure_name)
+            logger.info("Waiting for the server to acknowledge the save commands")
+            commandQueue.waitDrained(DRAIN_TIMEOUT)
 
         # Clean exit
-        logger.info("Build completed, disconnecting bot")
-        bot.quit()
+        nextStage('bot_disconnect')
+        if bot:
+            logger.info("Build completed, disconnecting bot")
+            bot.quit()
+        commandQueue.close()
         
-        dimensions = coordinateTracker.getDimensions()
+        dimensions = context.coordinateTracker.getDimensions()
         logger.info(f"Build dimensions: {dimensions}")
+        if commandQueue.commandsFailed:
+            logger.warning(f"{commandQueue.commandsFailed} of {commandQueue.commandsSent} commands failed, "
+                           f"the structure is incomplete")
+        nextStage(None)
         
-        return {
+        result = {
             'status': 'success',
             'structure_name': structure_name,
             'dimensions': dimensions,
+            'commands_sent': commandQueue.commandsSent,
+            'commands_failed': commandQueue.commandsFailed,
+            'commands_per_second': commandQueue.commandsPerSecond(),
+            'command_rate': commandQueue.rate.rate if commandQueue.rate else None,
+            'timings': timings,
             'metadata': metadata
         }
+        if structure_file:
+            result['structure_file'] = structure_file
+        return result
 
     except Exception as e:
         logger.exception(f'Build failed: {str(e)}')
-        if 'bot' in globals():
+        if bot:
             bot.quit()
+        if commandQueue:
+            commandQueue.close()
+        failedStage = stage
+        nextStage(None)
         return {
             'status': 'error',
             'error': str(e),
+            'stage': failedStage,
+            'timings': timings,
             'metadata': metadata
         }
-
-# Command queue system
-class CommandQueue:
-    def __init__(self, delay=DELAY):
-        self.queue = []
-        self.isProcessing = False
-        self.DELAY = delay
-        self.logger = logging.getLogger(__name__ + '.CommandQueue')
-
-    def add(self, command):
-        self.queue.append(command)
-        self.logger.debug(f"Added command to queue: {command}")
-        if not self.isProcessing:
-            self.isProcessing = True
-            thread = Thread(target=self.processQueue)
-            thread.start()
-
-    def processQueue(self):
-        self.logger.info("Started processing command queue")
-        while self.queue:
-            command = self.queue.pop(0)
-            try:
-                def handle_chat(username, message):
-                    if username == 'Server':
-                        self.logger.info(f"Command response: {message}")
-                    bot.remove_listener('chat', handle_chat)
-
-                bot.on('chat', handle_chat)
-                bot.chat(command)
-                self.logger.info(f'Executed command: {command}')
-            except Exception as e:
-                self.logger.error(f'Error executing command "{command}": {e}')
-            time.sleep(self.DELAY / 1000)
-        self.isProcessing = False
-        self.logger.info("Finished processing command queue")
-
-# Coordinate tracking system
-class CoordinateTracker:
-    def __init__(self):
-        self.coordinates = []
-        self.boundingBox = None
-        self.logger = logging.getLogger(__name__ + '.CoordinateTracker')
-
-    def addCoordinate(self, x, y, z):
-        self.coordinates.append({'x': x, 'y': y, 'z': z})
-        self.updateBoundingBox()
-        self.logger.debug(f"Added coordinate: ({x}, {y}, {z})")
-
-    def updateBoundingBox(self):
-        if not self.coordinates:
-            return
-
-        xs = [c['x'] for c in self.coordinates]
-        ys = [c['y'] for c in self.coordinates]
-        zs = [c['z'] for c in self.coordinates]
-
-        self.boundingBox = {
-            'min': {
-                'x': min(xs),
-                'y': min(ys),
-                'z': min(zs)
-            },
-            'max': {
-                'x': max(xs),
-                'y': max(ys),
-                'z': max(zs)
-            }
-        }
-        self.logger.debug(f"Updated bounding box: {self.boundingBox}")
-
-    def getBoundingBox(self):
-        return self.boundingBox
-
-    def getDimensions(self):
-        if not self.boundingBox:
-            return None
-        dimensions = {
-            'width': self.boundingBox['max']['x'] - self.boundingBox['min']['x'] + 1,
-            'height': self.boundingBox['max']['y'] - self.boundingBox['min']['y'] + 1,
-            'depth': self.boundingBox['max']['z'] - self.boundingBox['min']['z'] + 1
-        }
-        self.logger.info(f"Structure dimensions: {dimensions}")
-        return dimensions
-
-def safeSetBlock(x, y, z, blockType, options={}):
-    logger = logging.getLogger(__name__ + '.safeSetBlock')
-    # Ensure coordinates are integers
-    x, y, z = map(int, (x, y, z))
-    try:
-        # Add minecraft: namespace if not present
-        fullBlockType = blockType if ':' in blockType else f'minecraft:{blockType}'
-        command = f"/setblock {x} {y} {z} {fullBlockType}"
-
-        # Add block states if provided
-        blockStates = options.get('blockStates')
-        if blockStates and blockStates.keys():
-            stateString = ','.join([f"{key}={value}" for key, value in blockStates.items()])
-            command += f'[{stateString}]'
-
-        # Add placement mode if provided
-        mode = options.get('mode')
-        if mode:
-            validModes = ['replace', 'destroy', 'keep']
-            if mode not in validModes:
-                raise ValueError(f"Invalid placement mode: {mode}. Must be one of: {', '.join(validModes)}")
-            command += f' {mode}'
-
-        commandQueue.add(command)
-        coordinateTracker.addCoordinate(x, y, z)
-        logger.debug(f"Block placed at ({x}, {y}, {z}): {fullBlockType}")
-    except Exception as e:
-        logger.error(f"Error placing block at {x} {y} {z}: {e}")
-        raise e
-
-def safeFill(x1, y1, z1, x2, y2, z2, blockType, options={}):
-    logger = logging.getLogger(__name__ + '.safeFill')
-    # Ensure coordinates are integers
-    x1, y1, z1, x2, y2, z2 = map(int, (x1, y1, z1, x2, y2, z2))
-    try:
-        # Add minecraft: namespace if not present
-        fullBlockType = blockType if ':' in blockType else f'minecraft:{blockType}'
-        command = f"/fill {x1} {y1} {z1} {x2} {y2} {z2} {fullBlockType}"
-
-        # Add block states if provided
-        blockStates = options.get('blockStates')
-        if blockStates and blockStates.keys():
-            stateString = ','.join([f"{key}={value}" for key, value in blockStates.items()])
-            command += f'[{stateString}]'
-
-        # Handle fill modes and replace filter
-        mode = options.get('mode')
-        if mode:
-            validModes = ['destroy', 'hollow', 'keep', 'outline', 'replace']
-            if mode not in validModes:
-                raise ValueError(f"Invalid fill mode: {mode}. Must be one of: {', '.join(validModes)}")
-            command += f' {mode}'
-
-            # Handle replace filter if specified
-            if mode == 'replace' and options.get('replaceFilter'):
-                fullReplaceFilter = options['replaceFilter'] if ':' in options['replaceFilter'] else f"minecraft:{options['replaceFilter']}"
-                command += f' {fullReplaceFilter}'
-
-                # Add replace filter block states if provided
-                replaceFilterStates = options.get('replaceFilterStates')
-                if replaceFilterStates and replaceFilterStates.keys():
-                    filterStateString = ','.join([f"{key}={value}" for key, value in replaceFilterStates.items()])
-                    command += f'[{filterStateString}]'
-
-        commandQueue.add(command)
-
-        # Track corners of the filled region
-        for x in [x1, x2]:
-            for y in [y1, y2]:
-                for z in [z1, z2]:
-                    coordinateTracker.addCoordinate(x, y, z)
-        
-        logger.debug(f"Fill command executed from ({x1},{y1},{z1}) to ({x2},{y2},{z2}): {fullBlockType}")
-    except Exception as e:
-        logger.error(f"Error filling from ({x1},{y1},{z1}) to ({x2},{y2},{z2}): {e}")
-        raise e
-
-def saveStructure(name):
-    logger = logging.getLogger(__name__ + '.saveStructure')
-    boundingBox = coordinateTracker.getBoundingBox()
-    if not boundingBox:
-        logger.warning('No blocks placed yet to create structure')
-        return
-
-    min_x, min_y, min_z = boundingBox['min']['x'], boundingBox['min']['y'], boundingBox['min']['z']
-    max_x, max_y, max_z = boundingBox['max']['x'], boundingBox['max']['y'], boundingBox['max']['z']
-
-    # Use WorldEdit commands to select and copy the region
-    commandQueue.add(f"//pos1 {min_x},{min_y},{min_z}")
-    commandQueue.add(f"//pos2 {max_x},{max_y},{max_z}")
-    commandQueue.add("//copy")  # Copy the selection to clipboard
-
-    # Save the copied selection to a schematic file
-    commandQueue.add(f"//schem save {name}")
-
-    # Verify the save worked
-    commandQueue.add(f"//schem list")
-
-    logger.info(f"Structure saved: {name} from ({min_x}, {min_y}, {min_z}) to ({max_x}, {max_y}, {max_z})")
-
-def buildCreation(functionDefinition):
-    logger = logging.getLogger(__name__ + '.buildCreation')
-    logger.info("Starting build creation")
-    try:
-        exec(functionDefinition)
-        logger.info("Build creation completed successfully")
-    except Exception as e:
-        logger.error(f"Error during build creation: {e}")
-        raise e
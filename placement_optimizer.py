@@ -0,0 +1,89 @@
+import os
+import logging
+from build_commands import setblock_command, fill_command
+
+# Vanilla rejects /fill commands covering more blocks than this (commandModificationBlockLimit)
+MAX_FILL_VOLUME = int(os.getenv('MAX_FILL_VOLUME', '32768'))
+
+logger = logging.getLogger(__name__)
+
+
+def coalesce_blocks(blocks, max_volume=MAX_FILL_VOLUME):
+    """Greedily merge single block placements into cuboids of the same block.
+
+    ``blocks`` maps (x, y, z) to a block state string. Returns a list of
+    (x1, y1, z1, x2, y2, z2, block) cuboids that cover exactly the given positions, none
+    larger than ``max_volume`` blocks, ordered bottom-up. Each cuboid is grown from its
+    lowest corner along x, then z, then y, as far as the same block continues.
+    """
+    by_block = {}
+    for position, block in blocks.items():
+        by_block.setdefault(block, set()).add(position)
+
+    cuboids = []
+    for block, remaining in by_block.items():
+        for x, y, z in sorted(remaining, key=lambda p: (p[1], p[2], p[0])):
+            if (x, y, z) not in remaining:
+                continue  # Already covered by an earlier cuboid
+
+            x2 = x
+            while (x2 + 1, y, z) in remaining and (x2 + 2 - x) <= max_volume:
+                x2 += 1
+            width = x2 - x + 1
+
+            z2 = z
+            while (z2 + 2 - z) * width <= max_volume and all(
+                    (xi, y, z2 + 1) in remaining for xi in range(x, x2 + 1)):
+                z2 += 1
+            area = width * (z2 - z + 1)
+
+            y2 = y
+            while (y2 + 2 - y) * area <= max_volume and all(
+                    (xi, y2 + 1, zi) in remaining for zi in range(z, z2 + 1) for xi in range(x, x2 + 1)):
+                y2 += 1
+
+            for yi in range(y, y2 + 1):
+                for zi in range(z, z2 + 1):
+                    for xi in range(x, x2 + 1):
+                        remaining.discard((xi, yi, zi))
+            cuboids.append((x, y, z, x2, y2, z2, block))
+
+    cuboids.sort(key=lambda c: (c[1], c[2], c[0]))
+    return cuboids
+
+
+class PlacementBuffer:
+    """Collects plain block placements and emits them as a minimal set of setblock/fill commands.
+
+    Placements are buffered by position, so a later placement at the same position replaces
+    an earlier one. Anything whose result depends on what is already in the world (fills,
+    keep/destroy placements, structure saves) must call ``flush`` first, which keeps
+    last-writer-wins ordering between buffered and unbuffered commands.
+    """
+
+    def __init__(self, emit, max_volume=MAX_FILL_VOLUME, max_pending=100000):
+        self.emit = emit
+        self.max_volume = max_volume
+        self.max_pending = max_pending
+        self.pending = {}
+        self.placements = 0
+        self.commands = 0
+
+    def set_block(self, x, y, z, block):
+        self.pending[(x, y, z)] = block
+        self.placements += 1
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        for x1, y1, z1, x2, y2, z2, block in coalesce_blocks(self.pending, self.max_volume):
+            if (x1, y1, z1) == (x2, y2, z2):
+                self.emit(setblock_command(x1, y1, z1, block))
+            else:
+                self.emit(fill_command(x1, y1, z1, x2, y2, z2, block))
+            self.commands += 1
+        logger.info(f"Coalesced {len(self.pending)} block placements, "
+                    f"{self.placements} received so far, into {self.commands} commands")
+        self.pending = {}
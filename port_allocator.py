@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import fcntl
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PortAllocationError(Exception):
+    pass
+
+
+def is_port_free(port, host='0.0.0.0'):
+    """Check that nothing on the host is bound to a TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+def process_alive(pid):
+    """Whether a process with this PID is running on the host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running under another user
+    return True
+
+
+class PortAllocator:
+    """Leases game/RCON port pairs from a port range.
+
+    The range is split into adjacent pairs (game port, game port + 1). A pair is only
+    leased when both ports are free on the host, and the search continues after the last
+    leased pair so a just released pair is not handed out again right away. Leases are
+    persisted to ``lease_file`` with the PID of the orchestrator that holds them, so they
+    can be recovered after it crashes. Orchestrators may share the file: every change
+    re-reads it and writes it back while holding an exclusive lock on ``lease_file.lock``.
+    """
+
+    def __init__(self, port_range_start, port_range_end, lease_file='port_leases.json'):
+        if port_range_end - port_range_start < 1:
+            raise ValueError(f"Port range {port_range_start}-{port_range_end} is too small")
+        self.port_range_start = port_range_start
+        self.port_range_end = port_range_end
+        self.lease_file = lease_file
+        self.leases = {}  # server_id -> {'port', 'rcon_port', 'leased_at', 'pid'}
+        self._cursor = port_range_start
+        self._lock = threading.Lock()
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the lease file across processes, held from reading it to writing it back"""
+        with open(f"{self.lease_file}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        """Replace the in-memory leases with the file's, which include those of other orchestrators"""
+        if not os.path.exists(self.lease_file):
+            self.leases = {}
+            return
+        try:
+            with open(self.lease_file, 'r') as f:
+                self.leases = json.load(f)
+        except (IOError, ValueError) as e:
+            logger.error(f"Failed to read port leases from {self.lease_file}: {e}")
+
+    def _save(self):
+        tmp_file = f"{self.lease_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.leases, f)
+        os.replace(tmp_file, self.lease_file)
+
+    def _pairs_from_cursor(self):
+        first_pair = self.port_range_start
+        last_pair = self.port_range_end - 1
+        port = self._cursor
+        for _ in range((last_pair - first_pair) // 2 + 1):
+            if port > last_pair:
+                port = first_pair
+            yield port, port + 1
+            port += 2
+
+    def lease(self, server_id):
+        """Lease a free (port, rcon_port) pair for a server"""
+        with self._lock, self._file_lock():
+            self._load()
+            leased_ports = set()
+            for lease in self.leases.values():
+                leased_ports.update((lease['port'], lease['rcon_port']))
+
+            for port, rcon_port in self._pairs_from_cursor():
+                if port in leased_ports or rcon_port in leased_ports:
+                    continue
+                if not (is_port_free(port) and is_port_free(rcon_port)):
+                    logger.debug(f"Ports {port}/{rcon_port} are in use on the host, skipping")
+                    continue
+                self.leases[server_id] = {'port': port, 'rcon_port': rcon_port, 'leased_at': time.time(),
+                                          'pid': os.getpid()}
+                self._cursor = port + 2
+                self._save()
+                logger.info(f"Leased ports {port}/{rcon_port} to server {server_id}")
+                return port, rcon_port
+
+        raise PortAllocationError(
+            f"No free port pair in range {self.port_range_start}-{self.port_range_end}")
+
+    def release(self, server_id):
+        """Return a server's ports to the range"""
+        with self._lock, self._file_lock():
+            self._load()
+            lease = self.leases.pop(server_id, None)
+            if lease is None:
+                return
+            self._save()
+        logger.info(f"Released ports {lease['port']}/{lease['rcon_port']} of server {server_id}")
+
+    def recover(self, cleanup):
+        """Clean up servers that still hold leases from a previous run.
+
+        ``cleanup(server_id)`` must stop whatever is left of the server and return True on
+        success; only then is the lease released, so ports of servers that could not be
+        removed are never handed out again. Leases of an orchestrator that is still running
+        are left alone, and kept so their ports are not leased twice.
+        """
+        with self._lock, self._file_lock():
+            self._load()
+            stale = []
+            for server_id, lease in self.leases.items():
+                pid = lease.get('pid')
+                if pid and pid != os.getpid() and process_alive(pid):
+                    logger.warning(f"Server {server_id} belongs to running orchestrator {pid} sharing "
+                                   f"{self.lease_file}, not recovering it")
+                else:
+                    stale.append(server_id)
+        for server_id in stale:
+            logger.warning(f"Recovering port lease of server {server_id} from a previous run")
+            try:
+                if cleanup(server_id):
+                    self.release(server_id)
+            except Exception as e:
+                logger.error(f"Failed to recover server {server_id}: {e}")
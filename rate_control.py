@@ -0,0 +1,139 @@
+import os
+import re
+import time
+import logging
+from rcon_client import RconPool
+
+# Adaptive command rate: additive increase while the server keeps up, multiplicative decrease when it does not
+RATE_CONTROL = os.getenv('RATE_CONTROL', 'true').lower() == 'true'
+TARGET_MSPT = float(os.getenv('TARGET_MSPT', '40'))  # Milliseconds per tick before backing off, 50 is a full tick
+MIN_TPS = float(os.getenv('MIN_TPS', '19'))
+MAX_ACK_LATENCY = float(os.getenv('MAX_ACK_LATENCY', '2.0'))  # Seconds until a sent batch is acknowledged
+RATE_INCREASE = float(os.getenv('RATE_INCREASE', '0.05'))  # Fraction of the maximum rate added per step
+RATE_DECREASE = float(os.getenv('RATE_DECREASE', '0.5'))  # Factor the rate is multiplied by on overload
+RATE_ADJUST_INTERVAL = float(os.getenv('RATE_ADJUST_INTERVAL', '0.5'))  # Seconds between rate changes
+HEALTH_PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', '2'))  # Seconds between tps/mspt probes
+
+# Commands per second, per transport
+CHAT_RATE_MIN = float(os.getenv('CHAT_RATE_MIN', '0.5'))
+CHAT_RATE_MAX = float(os.getenv('CHAT_RATE_MAX', '20'))
+RCON_RATE_MIN = float(os.getenv('RCON_RATE_MIN', '100'))
+RCON_RATE_MAX = float(os.getenv('RCON_RATE_MAX', '20000'))
+
+FORMATTING_CODE = re.compile('§.')
+NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+logger = logging.getLogger(__name__)
+
+
+def parse_first_value(response):
+    """First number after the colon of a Paper tps/mspt reply, None for other replies"""
+    text = FORMATTING_CODE.sub('', response or '')
+    if ':' not in text or 'Unknown' in text:
+        return None
+    match = NUMBER.search(text.split(':', 1)[1])
+    return float(match.group()) if match else None
+
+
+class ServerHealthProbe:
+    """Reads tick health from a Paper server over RCON: TPS of the last minute and MSPT of the last 5s.
+
+    Servers without the tps/mspt commands report None and are not asked again.
+    """
+
+    def __init__(self, host, port, password):
+        self.pool = RconPool(host, password, port, max_size=1)
+        self.supported = True
+
+    def measure(self):
+        if not self.supported:
+            return None, None
+        try:
+            tps_response, mspt_response = self.pool.command_many(['tps', 'mspt'])
+        except Exception as e:
+            logger.debug(f"Health probe failed: {e}")
+            return None, None
+        tps, mspt = parse_first_value(tps_response), parse_first_value(mspt_response)
+        if tps is None and mspt is None:
+            logger.info("Server does not report tps/mspt, rate control uses acknowledgement latency only")
+            self.supported = False
+        return tps, mspt
+
+    def close(self):
+        self.pool.close()
+
+
+class AdaptiveRate:
+    """Paces commands at a rate adjusted AIMD-style from server feedback.
+
+    ``wait(count)`` blocks until ``count`` more commands fit the current rate. Senders
+    report each batch with ``acknowledged(count, latency)``. At most every
+    RATE_ADJUST_INTERVAL seconds the rate then grows by a fixed step while the server
+    keeps up and the rate is what holds commands back, or is cut by RATE_DECREASE when
+    acknowledgements take longer than ``max_ack_latency`` or the probed server runs below
+    ``min_tps`` or above ``target_mspt``.
+    """
+
+    def __init__(self, initial, minimum, maximum, probe=None, increase=RATE_INCREASE, decrease=RATE_DECREASE,
+                 target_mspt=TARGET_MSPT, min_tps=MIN_TPS, max_ack_latency=MAX_ACK_LATENCY,
+                 adjust_interval=RATE_ADJUST_INTERVAL, probe_interval=HEALTH_PROBE_INTERVAL):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.rate = min(max(initial, minimum), maximum)
+        self.step = maximum * increase
+        self.decrease = decrease
+        self.probe = probe
+        self.target_mspt = target_mspt
+        self.min_tps = min_tps
+        self.max_ack_latency = max_ack_latency
+        self.adjust_interval = adjust_interval
+        self.probe_interval = probe_interval
+        self.tps = None
+        self.mspt = None
+        self.next_send = time.monotonic()
+        self.last_adjust = self.last_probe = 0.0
+        self.overloaded = False
+        self.limited = False  # Whether the rate held commands back since the last adjustment
+
+    @classmethod
+    def for_chat(cls, probe=None, initial=1.0):
+        return cls(initial, CHAT_RATE_MIN, CHAT_RATE_MAX, probe)
+
+    @classmethod
+    def for_rcon(cls, probe=None, initial=RCON_RATE_MAX / 4):
+        return cls(initial, RCON_RATE_MIN, RCON_RATE_MAX, probe)
+
+    def wait(self, count=1):
+        now = time.monotonic()
+        if self.next_send > now:
+            self.limited = True
+            time.sleep(self.next_send - now)
+        self.next_send = max(self.next_send, now) + count / self.rate
+
+    def acknowledged(self, count, latency=None):
+        """Report that ``count`` commands were acknowledged ``latency`` seconds after being sent"""
+        now = time.monotonic()
+        if latency is not None and latency > self.max_ack_latency:
+            self.overloaded = True
+        if self.probe and now - self.last_probe >= self.probe_interval:
+            self.last_probe = now
+            self.tps, self.mspt = self.probe.measure()
+            if (self.tps is not None and self.tps < self.min_tps) or \
+                    (self.mspt is not None and self.mspt > self.target_mspt):
+                self.overloaded = True
+        if now - self.last_adjust < self.adjust_interval:
+            return
+        self.last_adjust = now
+        if self.overloaded:
+            self.rate = max(self.rate * self.decrease, self.minimum)
+            logger.info(f"Server is falling behind (tps {self.tps}, mspt {self.mspt}, ack latency "
+                        f"{latency if latency is None else round(latency, 3)}s), "
+                        f"lowering the command rate to {self.rate:.1f}/s")
+        elif self.limited:
+            # Only a rate that is actually holding commands back is raised
+            self.rate = min(self.rate + self.step, self.maximum)
+        self.overloaded = self.limited = False
+
+    def close(self):
+        if self.probe:
+            self.probe.close()
@@ -0,0 +1,340 @@
+import time
+import socket
+import struct
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# RCON packet types
+SERVERDATA_AUTH = 3
+SERVERDATA_EXECCOMMAND = 2
+# Any other type is answered with "Unknown request"; sent after a command, its reply marks
+# the end of a (possibly fragmented) command response
+SERVERDATA_SENTINEL = 100
+
+# The server splits responses into packets of this many characters
+RESPONSE_FRAGMENT_SIZE = 4096
+
+# The server reads one packet per socket read and drops the connection when a read holds
+# more than one, so a packet is only written once the previous one has been answered.
+
+
+class RconError(Exception):
+    pass
+
+
+def _encode_packet(request_id, packet_type, body):
+    payload = struct.pack('<ii', request_id, packet_type) + body.encode('utf-8') + b'\x00\x00'
+    return struct.pack('<i', len(payload)) + payload
+
+
+def _decode_packet(packet):
+    request_id, packet_type = struct.unpack('<ii', packet[:8])
+    return request_id, packet_type, packet[8:-2].decode('utf-8', errors='replace')
+
+
+def _may_continue(body):
+    """Whether a response packet is full, so more fragments of the response may follow it"""
+    # A full fragment is at least RESPONSE_FRAGMENT_SIZE bytes whatever its characters
+    return len(body.encode('utf-8')) >= RESPONSE_FRAGMENT_SIZE
+
+
+class RconClient:
+    """Minimal RCON client usable from any thread.
+
+    mcrcon installs a SIGALRM handler for its timeouts, which only works on the main
+    thread; this client relies on socket timeouts instead.
+    """
+
+    def __init__(self, host, password, port=25575, timeout=5.0):
+        self.host = host
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.socket = None
+        self.last_used = 0.0
+        self._next_id = 0
+
+    def __enter__(self):
+        if self.socket is None:
+            self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disconnect()
+
+    @property
+    def connected(self):
+        return self.socket is not None
+
+    def connect(self):
+        self.socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        request_id = self._send(SERVERDATA_AUTH, self.password)
+        response_id, _, _ = self._read()
+        if response_id == -1 or response_id != request_id:
+            self.disconnect()
+            raise RconError("RCON login failed")
+        self.last_used = time.time()
+
+    def disconnect(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            finally:
+                self.socket = None
+
+    def command(self, command):
+        """Run a command and return its response, reassembled if the server split it"""
+        if self.socket is None:
+            raise RconError("Not connected")
+        command_id = self._send(SERVERDATA_EXECCOMMAND, command)
+        fragments = [self._read_reply(command_id)]
+        if _may_continue(fragments[0]):
+            # Only the sentinel's reply tells whether another fragment is still coming
+            sentinel_id = self._send(SERVERDATA_SENTINEL, '')
+            while True:
+                request_id, _, body = self._read()
+                if request_id == sentinel_id:
+                    break
+                if request_id == command_id:
+                    fragments.append(body)
+        self.last_used = time.time()
+        return ''.join(fragments)
+
+    def command_many(self, commands):
+        """Run several commands over the connection, one after the other, and return their responses in order.
+
+        The commands share one connection and login, so a batch costs one round trip per
+        command and none for connecting.
+        """
+        return [self.command(command) for command in commands]
+
+    def _send(self, packet_type, body):
+        self._next_id = (self._next_id + 1) & 0x7FFFFFFF
+        self.socket.sendall(_encode_packet(self._next_id, packet_type, body))
+        return self._next_id
+
+    def _recv_exact(self, length):
+        data = bytearray()
+        while len(data) < length:
+            chunk = self.socket.recv(length - len(data))
+            if not chunk:
+                raise RconError("Connection closed by server")
+            data.extend(chunk)
+        return bytes(data)
+
+    def _read(self):
+        (length,) = struct.unpack('<i', self._recv_exact(4))
+        return _decode_packet(self._recv_exact(length))
+
+    def _read_reply(self, request_id):
+        """Body of the next packet answering ``request_id``, skipping replies to earlier requests"""
+        while True:
+            response_id, _, body = self._read()
+            if response_id == request_id:
+                return body
+
+
+class RconPool:
+    """Keeps up to ``max_size`` logged-in RCON connections to one server for reuse.
+
+    Connections idle for longer than ``max_idle`` seconds are dropped instead of reused, as
+    are connections that failed mid-command. Commands are retried once on a fresh
+    connection when the pooled one turns out to be dead.
+    """
+
+    def __init__(self, host, password, port, max_size=4, timeout=5.0, max_idle=60.0):
+        self.host = host
+        self.password = password
+        self.port = port
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def _acquire(self):
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RconError("RCON pool is closed")
+                while self._idle:
+                    client = self._idle.pop()
+                    if time.time() - client.last_used <= self.max_idle:
+                        return client
+                    client.disconnect()
+                    self._size -= 1
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                self._condition.wait(self.timeout)
+
+        client = RconClient(self.host, self.password, port=self.port, timeout=self.timeout)
+        try:
+            client.connect()
+        except Exception:
+            self._discard(client)
+            raise
+        return client
+
+    def _release(self, client):
+        with self._condition:
+            if self._closed:
+                client.disconnect()
+                self._size -= 1
+            else:
+                self._idle.append(client)
+            self._condition.notify()
+
+    def _discard(self, client):
+        client.disconnect()
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Lease a connection for the duration of a with block"""
+        client = self._acquire()
+        try:
+            yield client
+        except Exception:
+            self._discard(client)
+            raise
+        self._release(client)
+
+    def _call(self, method, argument):
+        for attempt in range(2):
+            try:
+                with self.connection() as client:
+                    return getattr(client, method)(argument)
+            except (OSError, RconError) as e:
+                if attempt == 1 or self._closed:
+                    raise
+                logger.info(f"RCON connection to {self.host}:{self.port} lost ({e}), reconnecting")
+                # Idle connections most likely died the same way (e.g. server restart)
+                self._drop_idle()
+
+    def command(self, command):
+        return self._call('command', command)
+
+    def command_many(self, commands):
+        return self._call('command_many', commands)
+
+    def _drop_idle(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for client in idle:
+            client.disconnect()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+        self._drop_idle()
+
+
+class AsyncRconClient:
+    """asyncio RCON client sharing one connection between coroutines.
+
+    Commands from concurrent coroutines take turns on the connection, as the server only
+    takes one packet at a time, so many coroutines (and many servers) can be driven from
+    one event loop without a thread per connection. A lost connection fails the command
+    in flight and is re-established by the next command.
+    """
+
+    def __init__(self, host, password, port=25575, timeout=5.0):
+        self.host = host
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._next_id = 0
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    def _allocate_id(self):
+        self._next_id = (self._next_id + 1) & 0x7FFFFFFF
+        return self._next_id
+
+    async def _read_packet(self):
+        (length,) = struct.unpack('<i', await self._reader.readexactly(4))
+        return _decode_packet(await self._reader.readexactly(length))
+
+    async def _send(self, packet_type, body):
+        request_id = self._allocate_id()
+        self._writer.write(_encode_packet(request_id, packet_type, body))
+        await self._writer.drain()
+        return request_id
+
+    async def _connect(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+            request_id = await self._send(SERVERDATA_AUTH, self.password)
+            response_id, _, _ = await asyncio.wait_for(self._read_packet(), self.timeout)
+            if response_id == -1 or response_id != request_id:
+                raise RconError("RCON login failed")
+        except BaseException:
+            # Never leave a connection behind that did not log in, the next command would use it
+            self._disconnect()
+            raise
+
+    async def connect(self):
+        async with self._lock:
+            if not self.connected:
+                await self._connect()
+
+    async def _read_reply(self, request_id):
+        while True:
+            response_id, _, body = await self._read_packet()
+            if response_id == request_id:
+                return body
+
+    async def _exchange(self, command):
+        command_id = await self._send(SERVERDATA_EXECCOMMAND, command)
+        fragments = [await self._read_reply(command_id)]
+        if _may_continue(fragments[0]):
+            sentinel_id = await self._send(SERVERDATA_SENTINEL, '')
+            while True:
+                request_id, _, body = await self._read_packet()
+                if request_id == sentinel_id:
+                    break
+                if request_id == command_id:
+                    fragments.append(body)
+        return ''.join(fragments)
+
+    async def command(self, command):
+        async with self._lock:
+            try:
+                if not self.connected:
+                    await self._connect()
+                return await asyncio.wait_for(self._exchange(command), self.timeout)
+            except (asyncio.IncompleteReadError, OSError, asyncio.TimeoutError) as e:
+                # The connection is in an unknown state, the next command reconnects
+                self._disconnect()
+                raise RconError(f"Connection lost: {e!r}")
+
+    async def command_many(self, commands):
+        """Run several commands one after the other and return their responses in order"""
+        return [await self.command(command) for command in commands]
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+    async def close(self):
+        self._disconnect()
@@ -0,0 +1,210 @@
+import re
+import json
+import time
+import socket
+import struct
+import logging
+import threading
+from rcon_client import RconClient
+
+logger = logging.getLogger(__name__)
+
+# Paper/vanilla log line printed once the world is loaded and the server accepts players
+READY_LOG_PATTERN = re.compile(r'Done \([0-9.,]+s\)! For help')
+
+# Log lines that mean the server will never become ready
+CRASH_LOG_PATTERNS = [
+    re.compile(r'Exception in server tick loop'),
+    re.compile(r'Failed to start the minecraft server'),
+    re.compile(r'This crash report has been saved to'),
+    re.compile(r'java\.lang\.OutOfMemoryError'),
+    re.compile(r'Error: Unable to access jarfile'),
+    re.compile(r'\*\*\*\* FAILED TO BIND TO PORT'),
+]
+
+
+def _pack_varint(value):
+    """Encode an int as a Minecraft protocol VarInt"""
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(sock):
+    """Read a Minecraft protocol VarInt from a socket"""
+    result = 0
+    for shift in range(0, 35, 7):
+        data = sock.recv(1)
+        if not data:
+            raise ConnectionError("Connection closed while reading VarInt")
+        byte = data[0]
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result
+    raise ValueError("VarInt is too long")
+
+
+def _recv_exact(sock, length):
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed while reading packet")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def server_list_ping(host, port, timeout=2.0):
+    """Query a server's status over the game port (server list ping) and return the status JSON"""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        host_bytes = host.encode('utf-8')
+        handshake = (
+            b'\x00'                           # Handshake packet id
+            + _pack_varint(-1)                # Protocol version (-1 is accepted for status queries)
+            + _pack_varint(len(host_bytes)) + host_bytes
+            + struct.pack('>H', port)
+            + _pack_varint(1)                 # Next state: status
+        )
+        sock.sendall(_pack_varint(len(handshake)) + handshake)
+        sock.sendall(b'\x01\x00')             # Status request
+
+        _read_varint(sock)                    # Packet length
+        packet_id = _read_varint(sock)
+        if packet_id != 0x00:
+            raise ValueError(f"Unexpected status response packet id: {packet_id}")
+        payload = _recv_exact(sock, _read_varint(sock))
+        return json.loads(payload.decode('utf-8'))
+
+
+class ServerReadinessMonitor:
+    """Follows a starting server's log stream and probes its ports to detect readiness or a crash.
+
+    The server is ready once it answers a server list ping on the game port and an RCON
+    command. Probes run every ``probe_interval`` seconds and immediately when the "Done"
+    line shows up in the logs; a crash line or the container exiting fails the wait at once.
+    """
+
+    def __init__(self, container, rcon_password, port, rcon_port, host='localhost',
+                 probe_interval=1.0, started_at=None):
+        self.container = container
+        self.rcon_password = rcon_password
+        self.port = port
+        self.rcon_port = rcon_port
+        self.host = host
+        self.probe_interval = probe_interval
+        self.started_at = started_at or time.time()
+
+        self.ready_at = None
+        self.log_ready_at = None
+        self.failure_reason = None
+
+        self._finished = threading.Event()
+        self._probe_now = threading.Event()
+        self._log_stream = None
+        self._threads = []
+
+    @property
+    def is_ready(self):
+        return self.ready_at is not None
+
+    @property
+    def latency(self):
+        """Seconds from server start to readiness, None until ready"""
+        if self.ready_at is None:
+            return None
+        return self.ready_at - self.started_at
+
+    def start(self):
+        for target in (self._follow_logs, self._probe_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def wait(self, timeout):
+        """Block until the server is ready, has failed or the timeout expires. Returns True when ready."""
+        if not self._finished.wait(timeout):
+            self._fail(f"Not ready within {timeout} seconds")
+        self.stop()
+        return self.is_ready
+
+    def stop(self):
+        self._finished.set()
+        self._probe_now.set()
+        if self._log_stream is not None:
+            try:
+                self._log_stream.close()
+            except Exception:
+                pass
+
+    def _mark_ready(self):
+        if self._finished.is_set():
+            return
+        self.ready_at = time.time()
+        self._finished.set()
+
+    def _fail(self, reason):
+        if self._finished.is_set():
+            return
+        self.failure_reason = reason
+        self._finished.set()
+
+    def _handle_log_line(self, line):
+        if READY_LOG_PATTERN.search(line):
+            self.log_ready_at = time.time()
+            logger.info(f"Server startup completed in logs after {self.log_ready_at - self.started_at:.1f}s")
+            self._probe_now.set()
+            return
+        for pattern in CRASH_LOG_PATTERNS:
+            if pattern.search(line):
+                self._fail(f"Server crashed: {line.strip()}")
+                return
+
+    def _follow_logs(self):
+        try:
+            self._log_stream = self.container.logs(stream=True, follow=True)
+            pending = b''
+            for chunk in self._log_stream:
+                pending += chunk
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    self._handle_log_line(line.decode('utf-8', errors='replace'))
+                if self._finished.is_set():
+                    return
+        except Exception as e:
+            if not self._finished.is_set():
+                logger.warning(f"Log stream interrupted: {e}")
+            return
+
+        # The log stream only ends on its own when the container stops
+        if not self._finished.is_set():
+            try:
+                self.container.reload()
+                status = self.container.status
+            except Exception:
+                status = 'unknown'
+            self._fail(f"Container stopped unexpectedly. Status: {status}")
+
+    def _probe(self):
+        try:
+            server_list_ping(self.host, self.port)
+            with RconClient(self.host, self.rcon_password, port=self.rcon_port) as rcon:
+                rcon.command("list")
+            return True
+        except Exception:
+            return False
+
+    def _probe_loop(self):
+        while not self._finished.is_set():
+            if self._probe():
+                self._mark_ready()
+                return
+            self._probe_now.wait(self.probe_interval)
+            self._probe_now.clear()
@@ -0,0 +1,94 @@
+import os
+import ast
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from metrics import CACHE_LOOKUPS
+
+# Finished builds remembered by the result cache, 0 disables it
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '1000'))
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_code(function_definition):
+    """Canonical form of a build function: its AST, so comments and formatting do not matter"""
+    try:
+        return ast.dump(ast.parse(function_definition or ''))
+    except SyntaxError:
+        # Fails in the sandbox either way, only identical text is a duplicate
+        return function_definition
+
+
+def build_key(function_definition, settings):
+    """Cache key of a build: the normalized code plus the settings that change its result"""
+    payload = json.dumps([normalize_code(function_definition), settings], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """Remembers successful build results by build key and shares running builds.
+
+    Entries are evicted least recently used first once there are more than ``max_entries``,
+    and dropped when ``validate(result)`` is false, e.g. because its structure is gone. A build submitted while an
+    identical one is running waits for that build instead of starting its own. Results
+    returned from the cache or from another job's build are copies marked 'cached'.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, validate=None):
+        self.max_entries = max_entries
+        self.validate = validate
+        self.entries = OrderedDict()
+        self.in_flight = {}
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            return None
+        if self.validate and not self.validate(result):
+            logger.info(f"Dropping cached build {key[:12]}: its result is no longer valid")
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            logger.debug(f"Evicted cached build {evicted[:12]}")
+
+    async def run(self, key, build):
+        """Return the result for ``key`` from the cache, from an identical running build, or from ``build()``"""
+        result = self.get(key)
+        if result is not None:
+            CACHE_LOOKUPS.labels('hit').inc()
+            logger.info(f"Build {key[:12]} served from the result cache")
+            return dict(result, cached=True)
+
+        if key in self.in_flight:
+            CACHE_LOOKUPS.labels('joined').inc()
+            logger.info(f"Build {key[:12]} is already running, waiting for its result")
+            return dict(await asyncio.shield(self.in_flight[key]), cached=True)
+
+        CACHE_LOOKUPS.labels('miss').inc()
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = await build()
+        except Exception as e:
+            future.set_result({'status': 'error', 'error': str(e)})
+            raise
+        else:
+            future.set_result(result)
+            # Builds with failed commands are incomplete and are built again next time
+            if result.get('status') == 'success' and not result.get('commands_failed'):
+                self.put(key, result)
+            return result
+        finally:
+            if not future.done():
+                future.set_result({'status': 'error', 'error': 'Identical build was cancelled'})
+            del self.in_flight[key]
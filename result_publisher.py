@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime, timezone
+from redis.asyncio import Redis
+
+# Celery's Redis result backend stores task meta under this prefix and publishes it on a channel of the same name
+TASK_KEY_PREFIX = 'celery-task-meta-'
+
+RESULT_BACKEND_URL = os.getenv('CELERY_RESULT_BACKEND', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+RESULT_EXPIRES = int(os.getenv('RESULT_EXPIRES', '86400'))  # Seconds, Celery's default of one day
+EVENT_STREAM = os.getenv('BUILD_EVENT_STREAM', 'minecraft_builder:events')
+EVENT_STREAM_MAXLEN = int(os.getenv('BUILD_EVENT_STREAM_MAXLEN', '10000'))
+
+logger = logging.getLogger(__name__)
+
+
+class ResultPublisher:
+    """Writes job stages and results to the Celery result backend and an event stream.
+
+    Every update is a single pipelined round trip: the task meta is stored with SET EX and
+    PUBLISHed on its key, which is what Celery's AsyncResult.get() subscribes to, and an
+    event is appended to EVENT_STREAM for consumers that are not Celery clients.
+    Publishing is best effort, a failure is logged and never fails the job.
+    """
+
+    def __init__(self, url=RESULT_BACKEND_URL, expires=RESULT_EXPIRES, stream=EVENT_STREAM,
+                 stream_maxlen=EVENT_STREAM_MAXLEN):
+        self.redis = Redis.from_url(url)
+        self.expires = expires
+        self.stream = stream
+        self.stream_maxlen = stream_maxlen
+
+    async def _store(self, task_id, state, result, event):
+        meta = json.dumps({
+            'status': state,
+            'result': result,
+            'traceback': None,
+            'children': [],
+            'date_done': datetime.now(timezone.utc).isoformat() if state in ('SUCCESS', 'FAILURE') else None,
+            'task_id': task_id
+        }, default=str)
+        key = f"{TASK_KEY_PREFIX}{task_id}"
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, meta, ex=self.expires)
+                pipe.publish(key, meta)
+                pipe.xadd(self.stream, {'task_id': task_id, 'state': state, **event},
+                          maxlen=self.stream_maxlen, approximate=True)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to publish {state} for job {task_id}: {e}")
+
+    async def stage(self, task_id, stage):
+        """Report that a job entered a stage, as a STARTED task whose info holds the stage"""
+        await self._store(task_id, 'STARTED', {'stage': stage, 'timestamp': time.time()}, {'stage': stage})
+
+    async def result(self, task_id, result):
+        """Report a finished job: SUCCESS with the build result, or FAILURE carrying its error"""
+        if result and result.get('status') == 'success':
+            event = {'status': 'success'}
+            if result.get('structure_digest'):
+                event['structure_digest'] = result['structure_digest']
+            await self._store(task_id, 'SUCCESS', result, event)
+            return
+        error = (result or {}).get('error', 'Build failed')
+        await self._store(task_id, 'FAILURE', {
+            'exc_type': 'RuntimeError',
+            'exc_message': [error],
+            'exc_module': 'builtins'
+        }, {'status': 'error', 'error': error})
+
+    async def close(self):
+        await self.redis.aclose()
@@ -0,0 +1,125 @@
+import gzip
+import struct
+
+# NBT tag ids
+TAG_END = 0
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+
+# Minecraft data versions written into schematics
+DATA_VERSIONS = {
+    '1.20.1': 3465,
+    '1.20.2': 3578,
+    '1.20.4': 3700,
+    '1.20.6': 3839,
+    '1.21': 3953,
+    '1.21.1': 3955,
+}
+
+
+def _name(tag_type, name):
+    encoded = name.encode('utf-8')
+    return struct.pack('>bH', tag_type, len(encoded)) + encoded
+
+
+def _short(name, value):
+    return _name(TAG_SHORT, name) + struct.pack('>H', value)
+
+
+def _int(name, value):
+    return _name(TAG_INT, name) + struct.pack('>i', value)
+
+
+def _byte_array(name, data):
+    return _name(TAG_BYTE_ARRAY, name) + struct.pack('>i', len(data)) + bytes(data)
+
+
+def _int_array(name, values):
+    return _name(TAG_INT_ARRAY, name) + struct.pack(f'>i{len(values)}i', len(values), *values)
+
+
+def _empty_compound_list(name):
+    return _name(TAG_LIST, name) + struct.pack('>bi', TAG_COMPOUND, 0)
+
+
+def _compound(name, *entries):
+    return _name(TAG_COMPOUND, name) + b''.join(entries) + bytes([TAG_END])
+
+
+def encode_varints(values):
+    """Encode palette indices as the unsigned LEB128 varints used for Sponge block data"""
+    values = list(values)
+    if not values or max(values) < 0x80:
+        return bytes(values)
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def schematic_nbt(width, height, length, palette, block_data, version=3, data_version=DATA_VERSIONS['1.20.4'],
+                  offset=(0, 0, 0)):
+    """Build the uncompressed NBT of a Sponge schematic.
+
+    ``palette`` is a list of block state strings and ``block_data`` the palette index of
+    every block in x, then z, then y order (index = x + z * width + y * width * length).
+    """
+    if version not in (2, 3):
+        raise ValueError(f"Unsupported Sponge schematic version: {version}")
+    if max(width, height, length) > 0xFFFF:
+        raise ValueError(f"Schematic of {width}x{height}x{length} blocks is too large")
+
+    palette_nbt = [_int(state, index) for index, state in enumerate(palette)]
+    data = encode_varints(block_data)
+    header = [
+        _int('Version', version),
+        _int('DataVersion', data_version),
+        _short('Width', width),
+        _short('Height', height),
+        _short('Length', length),
+        _int_array('Offset', list(offset)),
+    ]
+
+    if version == 2:
+        return _compound(
+            'Schematic',
+            *header,
+            _int('PaletteMax', len(palette)),
+            _compound('Palette', *palette_nbt),
+            _byte_array('BlockData', data),
+            _empty_compound_list('BlockEntities'),
+        )
+
+    return _compound(
+        '',
+        _compound(
+            'Schematic',
+            *header,
+            _compound(
+                'Blocks',
+                _compound('Palette', *palette_nbt),
+                _byte_array('Data', data),
+                _empty_compound_list('BlockEntities'),
+            ),
+        ),
+    )
+
+
+def schematic_from_grid(blocks, palette, version=3, data_version=DATA_VERSIONS['1.20.4']):
+    """Build the NBT of a schematic from a block grid indexed [y, z, x] holding palette indices"""
+    height, length, width = blocks.shape
+    return schematic_nbt(width, height, length, palette, blocks.ravel().tolist(), version, data_version)
+
+
+def write_schematic(path, nbt):
+    """Write schematic NBT gzip-compressed, as WorldEdit expects .schem files"""
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(nbt, mtime=0))
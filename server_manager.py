@@ -1,355 +1,909 @@
 import os
 import uuid
+import asyncio
+import functools
 import time
 import docker
 import secrets
 import logging
+import shutil
+import threading
+import yaml
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from mcrcon import MCRcon
 from celery import Celery
 from celery.result import AsyncResult
+from readiness import ServerReadinessMonitor
+from rcon_client import RconPool, AsyncRconClient
+from port_allocator import PortAllocator
+from voxel_simulator import simulate_build
+from build_sandbox import BuildSandbox, SandboxError
+from archive_stream import extract_file
+from container_spec import container_settings, data_directory, ContainerSpecError
+from structure_store import StructureStore
+from area_preparation import operations_extent, expand_box, region_fill_commands, forceload_commands
+from metrics import SERVERS, observe_build, scrape_value, stage_timer, STAGE_FAILURES
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Host ports leased to servers as game/RCON pairs
+PORT_RANGE_START = int(os.getenv('MC_PORT_RANGE_START', '25565'))
+PORT_RANGE_END = int(os.getenv('MC_PORT_RANGE_END', '25764'))
+# Orchestrators running from one directory need their own IDs, so they keep separate leases
+INSTANCE_ID = os.getenv('MC_INSTANCE_ID', '')
+PORT_LEASE_FILE = os.getenv('MC_PORT_LEASE_FILE',
+                            f'port_leases-{INSTANCE_ID}.json' if INSTANCE_ID else 'port_leases.json')
+
+# Compose template servers are created from, e.g. the one written by template_builder.py
+COMPOSE_TEMPLATE = os.getenv('MC_COMPOSE_TEMPLATE', 'base-compose.yml')
+
+# Distance in blocks along x between the plots of a multi-tenant server
+PLOT_SPACING = int(os.getenv('MC_PLOT_SPACING', '128'))
+
+# Server environment settings that change what a build produces, part of the result cache key
+RESULT_SETTINGS = ('VERSION', 'TYPE', 'LEVEL_TYPE', 'GENERATOR_SETTINGS')
+
+# Run builds through the offline voxel simulator before spending a server on them
+PREFLIGHT_SIMULATION = os.getenv('PREFLIGHT_SIMULATION', 'true').lower() == 'true'
+
 class MinecraftServerManager:
-    def __init__(self, base_port=25565):
+    def __init__(self, base_port=PORT_RANGE_START, port_range_end=PORT_RANGE_END, pool_min_size=0,
+                 pool_max_size=0, max_jobs_per_server=10, plots_per_server=1, plot_spacing=PLOT_SPACING,
+                 docker_client=None, worker_slots=1):
         self.base_port = base_port
         self.servers = {}
-        self.client = docker.from_env()
+        self.client = docker_client or docker.from_env()
+        self.port_allocator = PortAllocator(base_port, port_range_end, PORT_LEASE_FILE)
+
+        # Warm pool of pre-started servers (disabled when pool_max_size is 0)
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = max(pool_max_size, pool_min_size)
+        self.max_jobs_per_server = max_jobs_per_server
+        self.pool_servers = {}  # server_id -> server_info for every pooled server
+        self.idle_slots = deque()  # (server_id, plot) pairs ready to be handed out
+        self.pool_starting = 0  # pooled servers currently being started
+        self.pool_closed = False  # Set by stop_all_servers; servers that finish starting later are torn down
+        self.pool_condition = threading.Condition()
+        # Jobs wait for plots on threads of their own, one per worker slot, so jobs waiting
+        # for a plot never take the default executor threads the job holding it needs
+        self.pool_executor = ThreadPoolExecutor(max(worker_slots, 1) + 1, thread_name_prefix='pool')
+
+        # Pooled servers are split into plots that host one job each
+        self.plots_per_server = max(plots_per_server, 1)
+        self.plot_spacing = plot_spacing
+
+        # Persistent RCON connections, keyed by server_id
+        self.rcon_pools = {}
+        self.async_rcon_clients = {}
+
+        # Runs the build functions of jobs, which then only replay their recorded operations
+        self.sandbox = BuildSandbox()
+
+        # Exported schematics end up here, deduplicated and indexed by job
+        self.structure_store = StructureStore()
         
         # Load base compose template
         try:
-            with open('base-compose.yml', 'r') as f:
+            with open(COMPOSE_TEMPLATE, 'r') as f:
                 self.base_template = f.read()
         except FileNotFoundError:
-            logger.error("base-compose.yml not found. Ensure it exists in the current directory.")
+            logger.error(f"{COMPOSE_TEMPLATE} not found. Ensure it exists in the current directory.")
             raise
         except IOError as e:
-            logger.error(f"Error reading base-compose.yml: {e}")
+            logger.error(f"Error reading {COMPOSE_TEMPLATE}: {e}")
             raise
+
+        # Servers running at the same time must not write to one world
+        shared = self._data_directory('a')
+        if shared and shared == self._data_directory('b') and max(self.pool_max_size, worker_slots) > 1:
+            raise ContainerSpecError(f"Every server from {COMPOSE_TEMPLATE} bind-mounts {shared} on /data; "
+                                     f"give each server its own directory, e.g. ./data/mc-llm-{{llm_id}}")
+
+        # Release ports held by servers of a previous run that did not shut down cleanly
+        self.port_allocator.recover(self._cleanup_stale_server)
         
+        # Server counts are computed when metrics are scraped, not on every change
+        SERVERS.labels('dedicated').set_function(scrape_value(
+            lambda: sum('pool_key' not in server_info for server_info in list(self.servers.values()))))
+        SERVERS.labels('pooled').set_function(scrape_value(lambda: len(self.pool_servers)))
+        SERVERS.labels('pool_starting').set_function(scrape_value(lambda: self.pool_starting))
+        SERVERS.labels('idle_plots').set_function(scrape_value(lambda: len(self.idle_slots)))
+
         self.celery = Celery('minecraft_builder',
                              broker=os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0'))
         
         logger.info("MinecraftServerManager initialized successfully.")
         
-    def create_server(self, llm_id):
-        """Create a new Minecraft server for a given LLM"""
+    def _new_server_info(self, llm_id):
+        """Allocate ports and credentials for a new server"""
         server_id = str(uuid.uuid4())[:8]
-        port = self.base_port + len(self.servers)
-        rcon_port = port + 10
-        rcon_password = secrets.token_urlsafe(16)
-
+        port, rcon_port = self.port_allocator.lease(server_id)
         logger.info(f"Creating new server for LLM ID: {llm_id}, Server ID: {server_id}")
-
-        compose_content = self.base_template.format(
-            llm_id=server_id,
-            port=port,
-            rcon_port=rcon_port,
-            rcon_password=rcon_password
-        )
-
-        compose_file = f'compose-{server_id}.yml'
-        try:
-            with open(compose_file, 'w') as f:
-                f.write(compose_content)
-        except IOError as e:
-            logger.error(f"Failed to write compose file {compose_file}: {e}")
-            return None
-
-        # Start the container with explicit project name
-        project_name = f"mc-{server_id}"
-        start_command = f'docker-compose -p {project_name} -f {compose_file} up -d'
-        logger.info(f"Starting container with command: {start_command}")
-        os.system(start_command)
-        
-        # Store server info
-        self.servers[llm_id] = {
+        return {
             'server_id': server_id,
             'port': port,
             'rcon_port': rcon_port,
-            'compose_file': compose_file,
-            'rcon_password': rcon_password,
-            'project_name': project_name
+            'rcon_password': secrets.token_urlsafe(16),
+            'container_name': f"mc-llm-{server_id}"
         }
 
-        # Wait for container to be running
-        container_name = f"mc-llm-{server_id}"
-        logger.info(f"Waiting for container {container_name} to start...")
-        
-        retries = 0
-        max_retries = 10
-        while retries < max_retries:
+    def _container_settings(self, server_info):
+        """containers.run arguments of a server, rendered from the compose template"""
+        rendered = self.base_template.format(
+            llm_id=server_info['server_id'],
+            port=server_info['port'],
+            rcon_port=server_info['rcon_port'],
+            rcon_password=server_info['rcon_password']
+        )
+        return container_settings(yaml.safe_load(rendered)['services']['mc'])
+
+    def _data_directory(self, server_id):
+        """Host directory holding a server's world, or None when its /data is a Docker volume"""
+        return data_directory(self._container_settings(
+            {'server_id': server_id, 'port': 0, 'rcon_port': 0, 'rcon_password': ''}))
+
+    def _start_container(self, server_info):
+        """Create and start a server's container with one API call. Returns whether it started."""
+        server_info['created_at'] = time.time()
+        try:
+            settings = self._container_settings(server_info)
+            server_info['container_name'] = settings.get('name', server_info['container_name'])
+            container = self.client.containers.run(**settings)
+        except (docker.errors.APIError, ValueError, KeyError) as e:
+            logger.error(f"Failed to start container for server {server_info['server_id']}: {e}")
+            # run() creates the container before starting it, so a failed start leaves it behind
+            self._remove_container(server_info)
+            return False
+        server_info['container_name'] = container.name
+        logger.info(f"Container {container.name} started")
+        return True
+
+    def _remove_container(self, server_info):
+        """Kill and remove a server's container together with its volumes and world directory.
+        Returns whether it is gone."""
+        try:
+            self.client.containers.get(server_info['container_name']).remove(force=True, v=True)
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError as e:
+            logger.error(f"Failed to remove container of server {server_info['server_id']}: {e}")
+            return False
+        data_dir = self._data_directory(server_info['server_id'])
+        if data_dir and os.path.isdir(data_dir):
             try:
-                containers = self.client.containers.list(
-                    filters={"name": container_name}
-                )
-                if containers:
-                    container = containers[0]
-                    logger.info(f"Container {container_name} is {container.status}")
-                    break
-                retries += 1
-                time.sleep(3)
-            except docker.errors.NotFound:
-                logger.warning(f"Waiting for container to be created... (attempt {retries+1}/{max_retries})")
-                time.sleep(3)
-                continue
-        
-        if retries >= max_retries:
-            logger.error("Failed to find container after maximum retries")
+                shutil.rmtree(data_dir)
+            except OSError as e:
+                logger.warning(f"Failed to remove data directory {data_dir} of server {server_info['server_id']}: {e}")
+        return True
+
+    def create_server(self, llm_id):
+        """Create a new Minecraft server for a given LLM"""
+        server_info = self._new_server_info(llm_id)
+        started = False
+        try:
+            started = self._start_container(server_info)
+        finally:
+            # Also on unexpected errors, such as the Docker daemon being unreachable
+            if not started:
+                self.port_allocator.release(server_info['server_id'])
+        if not started:
+            return None
+        self.servers[llm_id] = server_info
+        return server_info['server_id']
+
+    async def create_server_async(self, llm_id):
+        """Create a new Minecraft server without blocking the event loop"""
+        server_info = self._new_server_info(llm_id)
+        started = False
+        try:
+            started = await self._run_blocking(self._start_container, server_info)
+        finally:
+            if not started:
+                self.port_allocator.release(server_info['server_id'])
+        if not started:
             return None
+        self.servers[llm_id] = server_info
+        return server_info['server_id']
 
-        # Initial delay to let server start up
-        logger.info("Waiting for initial server startup...")
-        time.sleep(45)  # Increased initial wait time
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking call (docker SDK, RCON, bot) in the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
 
-        return server_id
-        
-    def wait_for_server_ready(self, llm_id, timeout=600):  # Increased timeout to 10 minutes
-        """Wait for server to be ready with improved retry logic"""
+    async def _run_pool_call(self, func, *args, **kwargs):
+        """Run a pool call that may wait for other jobs (acquire, release) in the pool executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool_executor, functools.partial(func, *args, **kwargs))
+
+    def wait_for_server_ready(self, llm_id, timeout=600):
+        """Wait until the server answers on its game and RCON ports, or fail fast if it crashes"""
         server_info = self.servers.get(llm_id)
         if not server_info:
             logger.error(f"No server found for LLM {llm_id}")
             raise ValueError(f"No server found for LLM {llm_id}")
-            
-        start_time = time.time()
-        retry_interval = 10  # Start with 10 second retries
-        max_retry_interval = 30  # Max retry interval of 30 seconds
 
-        # Get container logs to check startup progress
-        container_name = f"mc-llm-{server_info['server_id']}"
         try:
-            container = self.client.containers.get(container_name)
+            container = self.client.containers.get(server_info['container_name'])
         except docker.errors.NotFound:
-            logger.error(f"Container {container_name} not found")
+            logger.error(f"Container {server_info['container_name']} not found")
             return False
-        
-        while time.time() - start_time < timeout:
-            try:
-                # Check container logs for successful startup
-                logs = container.logs(tail=50).decode('utf-8')
-                if "Done" in logs:  # Server typically logs "Done!" when ready
-                    logger.info("Server initialization detected in logs")
-                    
-                    # Try RCON connection
-                    with MCRcon("localhost", 
-                                server_info['rcon_password'],
-                                port=server_info['rcon_port']) as rcon:
-                        response = rcon.command("list")
-                        if response:
-                            logger.info(f"Server {llm_id} is ready!")
-                            return True
-
-            except ConnectionRefusedError:
-                logger.info(f"Server starting up... (waiting {retry_interval}s)")
-            except Exception as e:
-                logger.warning(f"Waiting for server... ({str(e)})")
-                
-            # Check if container is still running
-            container.reload()
-            if container.status != "running":
-                logger.error(f"Container stopped unexpectedly. Status: {container.status}")
-                return False
 
-            # Exponential backoff with max limit
-            time.sleep(retry_interval)
-            retry_interval = min(retry_interval * 1.5, max_retry_interval)
-                    
-        logger.error(f"Server {llm_id} failed to become ready within {timeout} seconds")
-        return False
+        monitor = ServerReadinessMonitor(
+            container,
+            server_info['rcon_password'],
+            server_info['port'],
+            server_info['rcon_port'],
+            started_at=server_info.get('created_at')
+        ).start()
 
-    def connect_rcon(self, llm_id):
-        """Establish RCON connection to a server"""
+        if not monitor.wait(timeout):
+            logger.error(f"Server {llm_id} failed to become ready: {monitor.failure_reason}")
+            return False
+
+        server_info['readiness_latency'] = monitor.latency
+        logger.info(f"Server {llm_id} is ready after {monitor.latency:.1f}s")
+        return True
+
+    def _get_server_info(self, llm_id):
         server_info = self.servers.get(llm_id)
         if not server_info:
             logger.error(f"No server found for LLM {llm_id}")
             raise ValueError(f"No server found for LLM {llm_id}")
-            
-        rcon = MCRcon(
-            "localhost", 
-            server_info['rcon_password'],
-            port=server_info['rcon_port']
-        )
-        rcon.connect()
-        return rcon
-    
+        return server_info
+
+    def _rcon_pool(self, server_info):
+        """Get the persistent RCON connection pool of a server"""
+        server_id = server_info['server_id']
+        pool = self.rcon_pools.get(server_id)
+        if pool is None:
+            pool = self.rcon_pools.setdefault(server_id, RconPool(
+                "localhost",
+                server_info['rcon_password'],
+                server_info['rcon_port']
+            ))
+        return pool
+
+    def _close_rcon(self, server_info):
+        pool = self.rcon_pools.pop(server_info['server_id'], None)
+        if pool:
+            pool.close()
+        # Async connections close themselves once the server goes away
+        self.async_rcon_clients.pop(server_info['server_id'], None)
+
+    def connect_rcon(self, llm_id):
+        """Lease a pooled RCON connection to a server for the duration of a with block"""
+        return self._rcon_pool(self._get_server_info(llm_id)).connection()
+
     def execute_command(self, llm_id, command):
         """Execute a command on the server via RCON"""
         try:
-            with self.connect_rcon(llm_id) as rcon:
-                response = rcon.command(command)
-                logger.info(f"Command executed on server {llm_id}: {command}")
-                return response
+            response = self._rcon_pool(self._get_server_info(llm_id)).command(command)
+            logger.info(f"Command executed on server {llm_id}: {command}")
+            return response
         except Exception as e:
             logger.error(f"Failed to execute command on server {llm_id}: {e}")
             return None
 
-    def prepare_building_area(self, llm_id, size=50):
-        """Prepare a flat area for building using vanilla commands"""
+    def execute_commands(self, llm_id, commands):
+        """Run several commands on the server over one RCON connection"""
+        return self._rcon_pool(self._get_server_info(llm_id)).command_many(commands)
+
+    async def execute_command_async(self, llm_id, command):
+        """Execute a command over the server's shared asyncio RCON connection"""
+        server_info = self._get_server_info(llm_id)
+        client = self.async_rcon_clients.get(server_info['server_id'])
+        if client is None:
+            client = AsyncRconClient("localhost", server_info['rcon_password'], port=server_info['rcon_port'])
+            self.async_rcon_clients[server_info['server_id']] = client
+        return await client.command(command)
+
+    def prepare_building_area(self, llm_id, size=50, extent=None, fresh=False):
+        """Prepare a flat area for building using vanilla commands.
+
+        ``extent`` is the (x1, y1, z1, x2, y2, z2) box a job's build touches, relative to its
+        plot. Only that box is cleared instead of the whole default area, and nothing is
+        cleared on a ``fresh`` server that was never built on.
+        """
         logger.info(f"Preparing building area for server {llm_id}")
-        with self.connect_rcon(llm_id) as rcon:
-            commands = [
-                # Clear the area
-                f"fill ~-{size} ~-1 ~-{size} ~{size} ~50 ~{size} air",
-                
-                # Create base platform
-                f"fill ~-{size} ~-1 ~-{size} ~{size} ~-1 ~{size} smooth_stone",
-                
-                # Create grid lines
-                f"fill ~-{size} ~-1 ~0 ~{size} ~-1 ~0 gray_concrete",
-                f"fill ~0 ~-1 ~-{size} ~0 ~-1 ~{size} gray_concrete",
-                
-                # Corner markers
-                f"setblock ~{size} ~0 ~{size} red_concrete",
-                f"setblock ~-{size} ~0 ~{size} blue_concrete", 
-                f"setblock ~{size} ~0 ~-{size} green_concrete",
-                f"setblock ~-{size} ~0 ~-{size} yellow_concrete",
-                
-                # Optimal visibility settings
-                "time set day",
-                "weather clear",
-                "gamerule doWeatherCycle false",
-                "gamerule doDaylightCycle false",
-            ]
-            
-            for cmd in commands:
-                response = rcon.command(cmd)
-                logger.debug(f"Command '{cmd}': {response}")
-                time.sleep(0.1)  # Small delay between commands
+        server_info = self._get_server_info(llm_id)
+        origin = server_info.get('plot_origin', (0, 0, 0))
+        self._prepare_plot(server_info, origin, size, self.build_area(origin, extent), fresh)
 
         # Op the bot player after the world is prepared
-        self.op_players(llm_id, ["Builder"])
+        self.op_players(llm_id, [server_info.get('bot_username', 'Builder')])
 
         logger.info(f"Building area prepared for server {llm_id}")
 
+    def plot_limits(self):
+        """(x1, x2) range along x, relative to the plot origin, that builds on shared servers must stay in, or None"""
+        if not self.pool_enabled or self.plots_per_server <= 1:
+            return None
+        half = self.plot_spacing // 2
+        return -half, half - 1
+
+    def build_area(self, origin, extent):
+        """World box a build with ``extent`` may change, kept inside its plot on shared servers"""
+        if not extent:
+            return None
+        limits = None
+        if self.plots_per_server > 1:
+            half = self.plot_spacing // 2
+            limits = (origin[0] - half, -2 ** 31, origin[0] + half - 1, 2 ** 31)
+        return expand_box(extent, offset=origin, limits=limits)
+
+    def load_build_area(self, llm_id, extent):
+        """Force-load the chunks of a job's build area so block commands never wait on chunk loading"""
+        server_info = self._get_server_info(llm_id)
+        area = self.build_area(server_info.get('plot_origin', (0, 0, 0)), extent)
+        if area:
+            self._rcon_pool(server_info).command_many(forceload_commands(area))
+
+    def unload_build_area(self, llm_id, size=50):
+        """Stop force-loading the chunks load_build_area loaded for a job on a pooled plot.
+
+        On shared servers only chunks lying wholly inside the job's plot are unloaded, so a
+        neighbouring plot's build never loses its chunks. The default area of a plot away from
+        spawn is force-loaded again, as it stays loaded between jobs.
+        """
+        server_info = self._get_server_info(llm_id)
+        origin = server_info.get('plot_origin', (0, 0, 0))
+        area = self.build_area(origin, server_info.get('build_extent'))
+        if area and self.plots_per_server > 1:
+            half = self.plot_spacing // 2
+            x1 = max(area[0], -((half - origin[0]) // 16) * 16)  # First chunk starting inside the plot
+            x2 = min(area[3], (origin[0] + half) // 16 * 16 - 1)  # Last chunk ending inside the plot
+            area = (x1, *area[1:3], x2, *area[4:]) if x1 <= x2 else None
+        if not area:
+            return
+        commands = forceload_commands(area, 'remove')
+        ox, oy, oz = origin
+        if (ox, oy, oz) != (0, 0, 0):
+            commands.append(f"execute positioned ~{ox} ~{oy} ~{oz} run forceload add ~-{size} ~-{size} ~{size} ~{size}")
+        self._rcon_pool(server_info).command_many(commands)
+
+    def _prepare_plot(self, server_info, origin, size=50, area=None, fresh=False):
+        """Clear and floor the area around a plot origin, given relative to world spawn.
+
+        ``area`` is a world box to force-load and clear instead of the default area. All
+        commands are sent over one RCON connection, and fills are split to stay
+        within the fill limit.
+        """
+        commands = []
+        if area:
+            commands += forceload_commands(area)
+            if not fresh:
+                commands += region_fill_commands(area)
+        elif not fresh:
+            # Clear the area
+            commands += region_fill_commands((-size, 0, -size, size, 50, size), relative=True)
+
+        plot_commands = [
+            # Create base platform
+            *region_fill_commands((-size, -1, -size, size, -1, size), 'smooth_stone', relative=True),
+
+            # Create grid lines
+            f"fill ~-{size} ~-1 ~0 ~{size} ~-1 ~0 gray_concrete",
+            f"fill ~0 ~-1 ~-{size} ~0 ~-1 ~{size} gray_concrete",
+
+            # Corner markers
+            f"setblock ~{size} ~0 ~{size} red_concrete",
+            f"setblock ~-{size} ~0 ~{size} blue_concrete",
+            f"setblock ~{size} ~0 ~-{size} green_concrete",
+            f"setblock ~-{size} ~0 ~-{size} yellow_concrete",
+        ]
+        ox, oy, oz = origin
+        if (ox, oy, oz) != (0, 0, 0):
+            # Plots away from spawn are kept loaded and their commands run at the plot origin
+            plot_commands.insert(0, f"forceload add ~-{size} ~-{size} ~{size} ~{size}")
+            plot_commands = [f"execute positioned ~{ox} ~{oy} ~{oz} run {command}" for command in plot_commands]
+        commands += plot_commands
+        commands += [
+            # Optimal visibility settings
+            "time set day",
+            "weather clear",
+            "gamerule doWeatherCycle false",
+            "gamerule doDaylightCycle false",
+        ]
+
+        responses = self._rcon_pool(server_info).command_many(commands)
+        for cmd, response in zip(commands, responses):
+            logger.debug(f"Command '{cmd}': {response}")
+
     def stop_server(self, llm_id):
         """Stop and cleanup a specific server"""
         server_info = self.servers.get(llm_id)
         if not server_info:
             logger.warning(f"No server found for LLM {llm_id} to stop")
             return
-            
-        # Stop the server using project name
-        stop_command = f'docker-compose -p {server_info["project_name"]} -f {server_info["compose_file"]} down -v'
-        logger.info(f"Stopping server {llm_id} with command: {stop_command}")
-        os.system(stop_command)
-        
-        # Cleanup compose file
-        if os.path.exists(server_info["compose_file"]):
-            os.remove(server_info["compose_file"])
-            logger.info(f"Removed compose file: {server_info['compose_file']}")
-            
+
+        self._teardown_server(server_info)
         del self.servers[llm_id]
         logger.info(f"Server {llm_id} stopped and cleaned up")
-        
+
+    async def stop_server_async(self, llm_id):
+        """Stop and cleanup a specific server without blocking the event loop"""
+        server_info = self.servers.get(llm_id)
+        if not server_info:
+            logger.warning(f"No server found for LLM {llm_id} to stop")
+            return
+
+        client = self.async_rcon_clients.get(server_info['server_id'])
+        self._close_rcon(server_info)
+        if client:
+            await client.close()
+        await self._run_blocking(self._remove_container, server_info)
+        self.port_allocator.release(server_info['server_id'])
+        del self.servers[llm_id]
+        logger.info(f"Server {llm_id} stopped and cleaned up")
+
+    def _teardown_server(self, server_info):
+        """Remove a server's container and release its ports"""
+        self._close_rcon(server_info)
+        logger.info(f"Stopping server {server_info['server_id']}")
+        self._remove_container(server_info)
+        self.port_allocator.release(server_info['server_id'])
+
+    def _cleanup_stale_server(self, server_id):
+        """Remove the container left behind by a server of a previous run; its lease is kept if that fails"""
+        return self._remove_container({'server_id': server_id, 'container_name': f"mc-llm-{server_id}"})
+
     def stop_all_servers(self):
-        """Stop all servers"""
+        """Stop all servers, removing their containers in parallel"""
         logger.info("Stopping all servers")
-        for llm_id in list(self.servers.keys()):
-            self.stop_server(llm_id)
+        dedicated = [server_info for server_info in self.servers.values() if 'pool_key' not in server_info]
+        self.servers.clear()
+        with self.pool_condition:
+            self.pool_closed = True
+            pooled = list(self.pool_servers.values())
+            self.pool_servers.clear()
+            self.idle_slots.clear()
+        servers = dedicated + pooled
+        if servers:
+            with ThreadPoolExecutor(len(servers)) as executor:
+                list(executor.map(self._teardown_server, servers))
         logger.info("All servers stopped")
 
+    @property
+    def pool_enabled(self):
+        return self.pool_max_size > 0
+
+    def build_settings(self):
+        """Server and export settings a build result depends on, for keying the result cache"""
+        from mineflayer import SCHEMATIC_EXPORT, SCHEMATIC_VERSION
+        environment = yaml.safe_load(self.base_template)['services']['mc']['environment']
+        settings = {name: environment.get(name) for name in RESULT_SETTINGS}
+        settings.update(schematic_export=SCHEMATIC_EXPORT, schematic_version=SCHEMATIC_VERSION)
+        return settings
+
+    def plot_origin(self, plot):
+        """Offset of a plot from world spawn; plot 0 is centered on spawn"""
+        return (plot * self.plot_spacing, 0, 0)
+
+    @staticmethod
+    def plot_bot_username(plot):
+        return 'Builder' if plot == 0 else f'Builder{plot}'
+
+    def _lease_plot(self, server_info, plot):
+        """A job's view of a pooled server: the shared server_info plus its own plot"""
+        return dict(
+            server_info,
+            pool_server=server_info,
+            plot=plot,
+            plot_origin=self.plot_origin(plot),
+            bot_username=self.plot_bot_username(plot)
+        )
+
+    def check_server_health(self, server_info):
+        """Check that a server's container is running and it answers RCON"""
+        try:
+            container = self.client.containers.get(server_info['container_name'])
+            if container.status != "running":
+                logger.warning(f"Server {server_info['server_id']} container is {container.status}")
+                return False
+            self._rcon_pool(server_info).command("list")
+            return True
+        except Exception as e:
+            logger.warning(f"Health check failed for server {server_info['server_id']}: {e}")
+            return False
+
+    def _start_pool_server(self):
+        """Start, wait for and prepare a new pooled server. Returns its server_info or None."""
+        pool_key = f"pool-{uuid.uuid4().hex[:8]}"
+        try:
+            if not self.create_server(pool_key):
+                raise Exception("Failed to create server")
+            if not self.wait_for_server_ready(pool_key, timeout=120):
+                raise Exception("Server failed to start")
+            self.prepare_building_area(pool_key, fresh=True)
+            server_info = self.servers[pool_key]
+            for plot in range(1, self.plots_per_server):
+                self._prepare_plot(server_info, self.plot_origin(plot), fresh=True)
+            self.op_players(pool_key, [self.plot_bot_username(plot) for plot in range(1, self.plots_per_server)])
+        except Exception as e:
+            logger.error(f"Failed to start pooled server: {e}")
+            self.stop_server(pool_key)
+            return None
+
+        server_info = self.servers.pop(pool_key)
+        server_info['pool_key'] = pool_key
+        server_info['jobs_served'] = 0
+        server_info['leases'] = 0
+        logger.info(f"Pooled server {server_info['server_id']} is ready with {self.plots_per_server} plots")
+        return server_info
+
+    def _add_pool_server(self, server_info):
+        """Register a started server and offer its plots. Call with pool_condition held."""
+        self.pool_servers[server_info['server_id']] = server_info
+        self.idle_slots.extend((server_info['server_id'], plot) for plot in range(self.plots_per_server))
+
+    def _retire_pool_server(self, server_info):
+        """Remove a server from the pool and tear it down once its last job is released"""
+        server_id = server_info['server_id']
+        with self.pool_condition:
+            self.pool_servers.pop(server_id, None)
+            self.idle_slots = deque(slot for slot in self.idle_slots if slot[0] != server_id)
+            server_info['retiring'] = True
+            teardown = server_info['leases'] == 0 and not server_info.get('stopped')
+            if teardown:
+                server_info['stopped'] = True
+            self.pool_condition.notify_all()
+        if not teardown:
+            if not server_info.get('stopped'):
+                logger.info(f"Retiring pooled server {server_id} once its {server_info['leases']} running jobs finish")
+            return
+        logger.info(f"Retiring pooled server {server_id} after {server_info['jobs_served']} jobs")
+        self._teardown_server(server_info)
+
+    def fill_pool(self):
+        """Start servers in parallel until the pool holds at least pool_min_size servers"""
+        with self.pool_condition:
+            missing = self.pool_min_size - len(self.pool_servers) - self.pool_starting
+            if missing <= 0:
+                return
+            self.pool_starting += missing
+
+        def start():
+            server_info = self._start_pool_server()
+            with self.pool_condition:
+                self.pool_starting -= 1
+                closed = self.pool_closed
+                if server_info and not closed:
+                    self._add_pool_server(server_info)
+                self.pool_condition.notify_all()
+            if server_info and closed:
+                self._teardown_server(server_info)
+
+        with ThreadPoolExecutor(missing) as executor:
+            for _ in range(missing):
+                executor.submit(start)
+
+    def maintain_pool(self):
+        """Health check servers without running jobs, replace the unhealthy ones and refill the pool"""
+        with self.pool_condition:
+            idle = [server_info for server_info in self.pool_servers.values() if server_info['leases'] == 0]
+        for server_info in idle:
+            if self.check_server_health(server_info):
+                continue
+            with self.pool_condition:
+                if server_info['leases']:
+                    continue  # Handed out in the meantime
+            self._retire_pool_server(server_info)
+        self.fill_pool()
+
+    def acquire_server(self, job_id, timeout=600):
+        """Lease a plot on a ready server from the pool, starting a new server if the pool has room"""
+        deadline = time.time() + timeout
+        while True:
+            server_info = None
+            start_new = False
+            with self.pool_condition:
+                while self.idle_slots and server_info is None:
+                    server_id, plot = self.idle_slots.popleft()
+                    candidate = self.pool_servers.get(server_id)
+                    # Plots beyond the server's job budget are dropped; it retires when its jobs finish
+                    if candidate and candidate['jobs_served'] + candidate['leases'] < self.max_jobs_per_server:
+                        server_info = candidate
+                        server_info['leases'] += 1
+                if server_info is None:
+                    if len(self.pool_servers) + self.pool_starting < self.pool_max_size:
+                        self.pool_starting += 1
+                        start_new = True
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            logger.error(f"No pooled server available for job {job_id} within {timeout} seconds")
+                            return None
+                        self.pool_condition.wait(remaining)
+                        continue
+
+            if start_new:
+                logger.info(f"Pool has no free plot, starting a new server for job {job_id}")
+                server_info = self._start_pool_server()
+                with self.pool_condition:
+                    self.pool_starting -= 1
+                    if server_info:
+                        self._add_pool_server(server_info)
+                        # The new server's first plot goes to this job
+                        self.idle_slots.remove((server_info['server_id'], 0))
+                        server_info['leases'] += 1
+                        plot = 0
+                    self.pool_condition.notify_all()
+                if not server_info:
+                    return None
+            elif not self.check_server_health(server_info):
+                with self.pool_condition:
+                    server_info['leases'] -= 1
+                self._retire_pool_server(server_info)
+                continue
+
+            self.servers[job_id] = self._lease_plot(server_info, plot)
+            logger.info(f"Leased plot {plot} of pooled server {server_info['server_id']} to job {job_id}")
+            return server_info['server_id']
+
+    def reset_server(self, llm_id):
+        """Return a job's plot to a clean state for the next job"""
+        server_info = self._get_server_info(llm_id)
+        ox, oy, oz = server_info.get('plot_origin', (0, 0, 0))
+        size = 50
+        # Only entities inside the plot are removed, other plots may still be building
+        self.execute_command(
+            llm_id,
+            f"execute positioned ~{ox - size} ~-64 ~{oz - size} run "
+            f"kill @e[type=!player,dx={2 * size},dy=384,dz={2 * size}]"
+        )
+        # Clears what the last job built, which may reach beyond the default area
+        self.prepare_building_area(llm_id, size, extent=server_info.get('build_extent'))
+
+    def release_server(self, job_id):
+        """Hand a leased plot back to the pool, or stop the server if it is not pooled"""
+        lease = self.servers.get(job_id)
+        if not lease or 'pool_key' not in lease:
+            self.stop_server(job_id)
+            return
+
+        server_info = lease['pool_server']
+        with self.pool_condition:
+            recycle = (not server_info.get('retiring')
+                       and server_info['jobs_served'] + server_info['leases'] < self.max_jobs_per_server)
+        if recycle:
+            try:
+                self.reset_server(job_id)
+            except Exception as e:
+                logger.warning(f"Failed to reset plot {lease['plot']} of server {server_info['server_id']}: {e}")
+                recycle = False
+        try:
+            self.unload_build_area(job_id)
+        except Exception as e:
+            logger.warning(f"Failed to unload the build area of plot {lease['plot']} "
+                           f"of server {server_info['server_id']}: {e}")
+        del self.servers[job_id]
+
+        with self.pool_condition:
+            server_info['leases'] -= 1
+            server_info['jobs_served'] += 1
+            recycle = recycle and not server_info.get('retiring')
+            if recycle:
+                self.idle_slots.append((server_info['server_id'], lease['plot']))
+                self.pool_condition.notify_all()
+        if recycle:
+            logger.info(f"Plot {lease['plot']} of server {server_info['server_id']} returned to pool "
+                        f"({server_info['jobs_served']}/{self.max_jobs_per_server} jobs served)")
+        else:
+            self._retire_pool_server(server_info)
+            # The replacement starts in the background, the job releasing its plot does not wait for it
+            threading.Thread(target=self.fill_pool, name='pool-fill', daemon=True).start()
+
     def op_players(self, llm_id, players):
         """Give operator privileges to specified players"""
         try:
-            with self.connect_rcon(llm_id) as rcon:
-                for player in players:
-                    response = rcon.command(f"op {player}")
-                    logger.info(f"Opping player {player} on server {llm_id}: {response}")
+            if not players:
+                return
+            responses = self.execute_commands(llm_id, [f"op {player}" for player in players])
+            for player, response in zip(players, responses):
+                logger.info(f"Opping player {player} on server {llm_id}: {response}")
         except Exception as e:
             logger.error(f"Failed to op players on server {llm_id}: {e}")
 
-    async def process_build_job(self, job_id, function_definition, metadata=None):
-        """Process a build job from start to finish"""
+    async def process_build_job(self, job_id, function_definition, metadata=None, transport=None,
+                                on_stage=None, on_result=None):
+        """Process a build job from start to finish.
+
+        ``on_stage(job_id, stage)`` and ``on_result(job_id, result)`` are optional coroutines
+        called as the job progresses; the result is reported before the server is cleaned up.
+        """
         logger.info(f"Starting build job {job_id}")
+
+        async def stage(name):
+            if on_stage:
+                await on_stage(job_id, name)
+
+        async def finish(result):
+            if on_result:
+                await on_result(job_id, result)
+            return result
+
+        # Run the untrusted build function in a limited worker before spending a server on it
+        await stage('sandboxing')
         try:
-            # Create server
-            server_id = self.create_server(job_id)
-            if not server_id:
-                raise Exception("Failed to create server")
+            with stage_timer('sandbox'):
+                operations = await self._run_blocking(self.sandbox.run, function_definition)
+        except SandboxError as e:
+            logger.error(f"Build job {job_id} failed in the sandbox: {e}")
+            return await finish({
+                'status': 'error',
+                'error': f"Build function failed: {e}",
+                'stage': 'sandbox',
+                'metadata': metadata
+            })
 
-            # Wait for server ready with increased timeout
-            if not self.wait_for_server_ready(job_id, timeout=120):  # Increased to 2 minutes
-                raise Exception("Server failed to start")
+        extent = await self._run_blocking(operations_extent, operations)
 
-            # Prepare building area
-            self.prepare_building_area(job_id)
+        # Placements are only shifted into a plot, a wider build would write into its neighbours
+        limits = self.plot_limits()
+        if extent and limits and (extent[0] < limits[0] or extent[3] > limits[1]):
+            STAGE_FAILURES.labels('plot_bounds').inc()
+            error = (f"Build spans x {extent[0]} to {extent[3]}, beyond its plot's x {limits[0]} to {limits[1]}; "
+                     f"builds on shared servers must fit within MC_PLOT_SPACING ({self.plot_spacing}) blocks")
+            logger.error(f"Build job {job_id} rejected: {error}")
+            return await finish({
+                'status': 'error',
+                'error': error,
+                'stage': 'plot_bounds',
+                'metadata': metadata
+            })
+
+        simulation = None
+        if PREFLIGHT_SIMULATION:
+            # Builds that fail or are empty offline would fail on a server too
+            await stage('simulating')
+            with stage_timer('simulate'):
+                simulation = await self._run_blocking(simulate_build, operations=operations)
+            if simulation['status'] != 'success' or not simulation['block_count']:
+                STAGE_FAILURES.labels('simulate').inc()
+                error = simulation.get('error', 'Build places no blocks')
+                logger.error(f"Build job {job_id} rejected by preflight simulation: {error}")
+                return await finish({
+                    'status': 'error',
+                    'error': f"Preflight simulation failed: {error}",
+                    'stage': 'simulate',
+                    'metadata': metadata
+                })
+
+        try:
+            if self.pool_enabled:
+                # Pooled servers are already running with a prepared building area
+                await stage('acquiring_server')
+                with stage_timer('acquire_server'):
+                    server_id = await self._run_pool_call(self.acquire_server, job_id)
+                    if not server_id:
+                        raise Exception("Failed to acquire pooled server")
+                self.servers[job_id]['build_extent'] = extent
+
+                # The plot was cleared when it was released, only its chunks need loading
+                with stage_timer('prepare_area'):
+                    await self._run_blocking(self.load_build_area, job_id, extent)
+            else:
+                # Create server
+                await stage('starting_server')
+                with stage_timer('container_start'):
+                    server_id = await self.create_server_async(job_id)
+                    if not server_id:
+                        raise Exception("Failed to create server")
+
+                # Wait for server ready with increased timeout
+                with stage_timer('readiness'):
+                    if not await self._run_blocking(self.wait_for_server_ready, job_id, timeout=120):
+                        raise Exception("Server failed to start")
+
+                # Prepare building area
+                await stage('preparing_area')
+                with stage_timer('prepare_area'):
+                    await self._run_blocking(functools.partial(
+                        self.prepare_building_area, job_id, extent=extent, fresh=True))
 
-            # Set environment variables for mineflayer
             server_info = self.servers[job_id]
-            os.environ['HOST'] = 'localhost'
-            os.environ['PORT'] = str(server_info['port'])
-            os.environ['USERNAME'] = 'Builder'
-            
-            # Add additional delay for server stability
-            logger.info("Waiting for server to stabilize...")
-            time.sleep(20)  # Increased from 10 to 20 seconds
-
-            # Verify server is accepting connections via RCON
-            retries = 3
-            while retries > 0:
-                try:
-                    with self.connect_rcon(job_id) as rcon:
-                        response = rcon.command("list")
-                        logger.info(f"Server response: {response}")
-                        break
-                except Exception as e:
-                    logger.warning(f"RCON connection attempt failed ({retries} retries left): {e}")
-                    retries -= 1
-                    if retries == 0:
-                        raise Exception("Server not responding to RCON commands")
-                    time.sleep(5)
-
-            # Execute build with retry logic
-            from mineflayer import build_structure
+
+            # Execute build
             logger.info(f"Executing build for job {job_id}")
-            result = build_structure(function_definition, metadata)
-            
-            if result['status'] == 'success':
-                container_name = f"mc-llm-{server_info['server_id']}"
-                # Possible paths to check
-                possible_paths = [
-                    f"/data/plugins/WorldEdit/schematics/{result['structure_name']}.schem",
-                    f"/data/worldedit/schematics/{result['structure_name']}.schem",
-                    f"/data/plugins/worldedit/schematics/{result['structure_name']}.schem",
-                ]
-
-                try:
-                    container = self.client.containers.get(container_name)
-                    # Create local structures directory
-                    os.makedirs('structures', exist_ok=True)
-                    found = False
-                    for structure_path in possible_paths:
-                        try:
-                            bits, stat = container.get_archive(structure_path)
-                            with open(f"structures/{result['structure_name']}.schem", 'wb') as f:
-                                for chunk in bits:
-                                    f.write(chunk)
-                            logger.info(f"Structure exported to structures/{result['structure_name']}.schem")
-                            result['structure_file'] = f"structures/{result['structure_name']}.schem"
-                            found = True
-                            break
-                        except Exception as e:
-                            logger.warning(f"Structure not found at {structure_path}: {e}")
-                    if not found:
-                        logger.error("Failed to export structure: No valid structure file found.")
-                        result['structure_export_error'] = "No valid structure file found."
-                except Exception as e:
-                    logger.error(f"Failed to export structure: {e}")
-                    result['structure_export_error'] = str(e)
+            await stage('building')
+            with stage_timer('build'):
+                result = await self._run_blocking(self._run_build, server_info, operations, metadata, transport,
+                                                  f"structure_{job_id}")
+            observe_build(result)
 
-            return result
+            # Natively exported builds already have their structure file
+            if result['status'] == 'success' and 'structure_file' not in result:
+                await stage('exporting')
+                with stage_timer('structure_copy'):
+                    await self._run_blocking(self._export_structure, server_info, result)
+                if 'structure_export_error' in result:
+                    STAGE_FAILURES.labels('structure_copy').inc()
+
+            if 'structure_file' in result:
+                await stage('storing')
+                with stage_timer('structure_store'):
+                    await self._run_blocking(self._store_structure, job_id, result)
+
+            if simulation:
+                result['simulation'] = {
+                    'block_count': simulation['block_count'],
+                    'dimensions': simulation['dimensions'],
+                    'elapsed': simulation['elapsed']
+                }
+                if simulation.get('sparse'):
+                    result['simulation']['sparse'] = True
+            return await finish(result)
 
         except Exception as e:
             logger.error(f"Build job {job_id} failed: {str(e)}")
-            return {
+            return await finish({
                 'status': 'error',
                 'error': str(e),
                 'metadata': metadata
-            }
+            })
         finally:
-            # Always cleanup the server
+            # Always cleanup the server (pooled servers are recycled)
             logger.info(f"Cleaning up server for job {job_id}")
-            self.stop_server(job_id)
+            server_info = self.servers.get(job_id)
+            if server_info and 'pool_key' in server_info:
+                with stage_timer('release'):
+                    await self._run_pool_call(self.release_server, job_id)
+            else:
+                with stage_timer('teardown'):
+                    await self.stop_server_async(job_id)
+
+    def _run_build(self, server_info, operations, metadata, transport=None, structure_name=None):
+        """Replay a job's recorded operations against a server with a mineflayer build"""
+        from mineflayer import build_structure
+        return build_structure(
+            metadata=metadata,
+            host='localhost',
+            port=server_info['port'],
+            transport=transport,
+            rcon_port=server_info['rcon_port'],
+            rcon_password=server_info['rcon_password'],
+            username=server_info.get('bot_username'),
+            origin=server_info.get('plot_origin'),
+            operations=operations,
+            structure_name=structure_name
+        )
+
+    def _store_structure(self, job_id, result):
+        """Move the exported schematic into the structure store, replacing the file with its digest"""
+        path = result.pop('structure_file')
+        blob = self.structure_store.put_file(job_id, path, name=result['structure_name'],
+                                             metadata=result.get('metadata'), dimensions=result.get('dimensions'))
+        os.remove(path)
+        result['structure_digest'] = blob['digest']
+        result['structure_size'] = blob['size']
+
+    def _export_structure(self, server_info, result):
+        """Stream the saved schematic out of the server container into the structure store's staging directory"""
+        # Directories WorldEdit may save schematics to, depending on the plugin version
+        possible_paths = [
+            f"/data/plugins/WorldEdit/schematics/{result['structure_name']}.schem",
+            f"/data/worldedit/schematics/{result['structure_name']}.schem",
+            f"/data/plugins/worldedit/schematics/{result['structure_name']}.schem",
+        ]
+        destination = os.path.join(self.structure_store.staging_dir, f"{result['structure_name']}.schem")
+
+        try:
+            container = self.client.containers.get(server_info['container_name'])
+            # One listing finds which of the candidate paths exists
+            _, (stdout, _) = container.exec_run(['ls', '-1d', *possible_paths], demux=True)
+            found = (stdout or b'').decode().split()
+            if not found:
+                logger.error("Failed to export structure: No valid structure file found.")
+                result['structure_export_error'] = "No valid structure file found."
+                return
+
+            bits, stat = container.get_archive(found[0])
+            size = extract_file(bits, destination)
+            logger.info(f"Structure exported to {destination} ({size} bytes)")
+            result['structure_file'] = destination
+        except Exception as e:
+            logger.error(f"Failed to export structure: {e}")
+            result['structure_export_error'] = str(e)
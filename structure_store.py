@@ -0,0 +1,304 @@
+"""Content-addressed store for exported structures.
+
+Schematics are stored once per distinct content: the blob name is the SHA-256 of the
+decompressed NBT, so identical builds share a blob whatever gzip settings wrote them.
+Blobs are kept xz-compressed on a pluggable backend (local disk or an S3-compatible
+service such as MinIO) and a SQLite index maps job IDs and their metadata to blobs.
+Blobs are compressed and read back in COPY_BUFFER_SIZE pieces, never whole.
+
+    python structure_store.py import structures/*.schem       # move loose schematics into the store
+    python structure_store.py list --name "Simple House"
+    python structure_store.py export --all --output evaluation/
+"""
+import os
+import gzip
+import json
+import lzma
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from archive_stream import COPY_BUFFER_SIZE
+
+# Where structures are kept
+STRUCTURE_STORE = os.getenv('STRUCTURE_STORE', 'local')  # 'local' or 's3'
+STRUCTURE_STORE_PATH = os.getenv('STRUCTURE_STORE_PATH', 'structures')  # Blobs of the local backend
+STRUCTURE_INDEX = os.getenv('STRUCTURE_INDEX', os.path.join(STRUCTURE_STORE_PATH, 'index.sqlite3'))
+STRUCTURE_S3_ENDPOINT = os.getenv('STRUCTURE_S3_ENDPOINT', 'http://localhost:9000')
+STRUCTURE_S3_BUCKET = os.getenv('STRUCTURE_S3_BUCKET', 'structures')
+STRUCTURE_COMPRESSION_PRESET = int(os.getenv('STRUCTURE_COMPRESSION_PRESET', '6'))  # xz preset, 0-9
+STRUCTURE_STORE_WORKERS = int(os.getenv('STRUCTURE_STORE_WORKERS', '8'))  # Parallel bulk reads/writes
+
+logger = logging.getLogger(__name__)
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS structures (
+    job_id TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    name TEXT,
+    metadata TEXT,
+    dimensions TEXT,
+    size INTEGER,
+    stored_size INTEGER,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS structures_digest ON structures (digest);
+"""
+
+
+def blob_key(digest):
+    return f"blobs/{digest[:2]}/{digest}.nbt.xz"
+
+
+class LocalBackend:
+    """Blobs as files under ``root``"""
+
+    def __init__(self, root=STRUCTURE_STORE_PATH):
+        self.root = root
+
+    def _path(self, digest):
+        return os.path.join(self.root, blob_key(digest))
+
+    def exists(self, digest):
+        return os.path.exists(self._path(digest))
+
+    def put(self, digest, source):
+        """Move the finished blob file ``source`` into place"""
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(source, path)
+
+    def open(self, digest):
+        return open(self._path(digest), 'rb')
+
+
+class S3Backend:
+    """Blobs as objects in an S3-compatible bucket. Needs boto3."""
+
+    def __init__(self, bucket=STRUCTURE_S3_BUCKET, endpoint_url=STRUCTURE_S3_ENDPOINT):
+        # Imported on first use so boto3 is only needed with this backend
+        import boto3
+        from botocore.exceptions import ClientError
+        self._ClientError = ClientError
+        self.bucket = bucket
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+
+    def exists(self, digest):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=blob_key(digest))
+            return True
+        except self._ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put(self, digest, source):
+        # upload_file streams the file, in multipart uploads when it is large
+        self.client.upload_file(source, self.bucket, blob_key(digest))
+        os.remove(source)
+
+    def open(self, digest):
+        return self.client.get_object(Bucket=self.bucket, Key=blob_key(digest))['Body']
+
+
+def backend_from_env():
+    if STRUCTURE_STORE == 'local':
+        return LocalBackend()
+    if STRUCTURE_STORE == 's3':
+        return S3Backend()
+    raise ValueError(f"Invalid STRUCTURE_STORE: {STRUCTURE_STORE}. Must be one of: local, s3")
+
+
+class StructureStore:
+    """Stores schematic files by content and indexes them by job.
+
+    ``put_file`` compresses a .schem file into a blob, skipping the upload when a blob with
+    the same content exists, and records the job in the index. ``export`` writes a job's
+    structure back out as a .schem file. The index is shared by threads, each with its
+    own SQLite connection.
+    """
+
+    def __init__(self, backend=None, index_path=STRUCTURE_INDEX, staging_dir=STRUCTURE_STORE_PATH):
+        self.backend = backend or backend_from_env()
+        self.index_path = index_path
+        self.staging_dir = staging_dir
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        os.makedirs(staging_dir, exist_ok=True)
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(INDEX_SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.index_path, timeout=30)
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    def _compress(self, path):
+        """Hash and xz-compress a gzipped schematic in one pass into a staging file"""
+        digest = hashlib.sha256()
+        size = 0
+        compressor = lzma.LZMACompressor(preset=STRUCTURE_COMPRESSION_PRESET)
+        staged = tempfile.NamedTemporaryFile(dir=self.staging_dir, suffix='.part', delete=False)
+        try:
+            with staged, gzip.open(path, 'rb') as source:
+                while True:
+                    chunk = source.read(COPY_BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    staged.write(compressor.compress(chunk))
+                staged.write(compressor.flush())
+        except BaseException:
+            os.remove(staged.name)
+            raise
+        return digest.hexdigest(), size, staged.name
+
+    def _store_blob(self, path):
+        digest, size, staged = self._compress(path)
+        stored_size = os.path.getsize(staged)
+        deduplicated = self.backend.exists(digest)
+        if deduplicated:
+            os.remove(staged)
+        else:
+            self.backend.put(digest, staged)
+        return {'digest': digest, 'size': size, 'stored_size': stored_size, 'deduplicated': deduplicated}
+
+    def put_many(self, items, workers=STRUCTURE_STORE_WORKERS):
+        """Store (job_id, path, name, metadata, dimensions) items, compressing in parallel and indexing at once.
+
+        Returns the blob record of every item, in order.
+        """
+        items = list(items)
+        with ThreadPoolExecutor(max(1, min(workers, len(items)))) as pool:
+            blobs = list(pool.map(lambda item: self._store_blob(item[1]), items))
+        now = time.time()
+        with self._db() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO structures VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(job_id, blob['digest'], name, json.dumps(metadata), json.dumps(dimensions), blob['size'],
+                  blob['stored_size'], now)
+                 for (job_id, _, name, metadata, dimensions), blob in zip(items, blobs)]
+            )
+        return blobs
+
+    def put_file(self, job_id, path, name=None, metadata=None, dimensions=None):
+        """Store one schematic file for a job and return its blob record"""
+        blob = self.put_many([(job_id, path, name, metadata, dimensions)], workers=1)[0]
+        logger.info(f"Stored structure of job {job_id} as {blob['digest'][:12]} "
+                    f"({blob['size']} bytes, {blob['stored_size']} stored"
+                    f"{', already present' if blob['deduplicated'] else ''})")
+        return blob
+
+    def link(self, job_id, digest, name=None, metadata=None, dimensions=None):
+        """Index a job under a blob that is already stored, e.g. a cached result"""
+        with self._db() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO structures '
+                'SELECT ?, digest, ?, ?, ?, size, stored_size, ? FROM structures WHERE digest = ? LIMIT 1',
+                (job_id, name, json.dumps(metadata), json.dumps(dimensions), time.time(), digest)
+            )
+
+    def has_blob(self, digest):
+        return self.backend.exists(digest)
+
+    def get(self, job_id):
+        """The index record of a job, or None"""
+        row = self._db().execute('SELECT * FROM structures WHERE job_id = ?', (job_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def find(self, name=None, since=None, **metadata):
+        """Index records by structure name, creation time and metadata fields, oldest first"""
+        query, params = 'SELECT * FROM structures WHERE 1', []
+        if name is not None:
+            query += ' AND name = ?'
+            params.append(name)
+        if since is not None:
+            query += ' AND created_at >= ?'
+            params.append(since)
+        for field, value in metadata.items():
+            query += ' AND json_extract(metadata, ?) = ?'
+            params += [f'$.{field}', value]
+        return [self._record(row) for row in self._db().execute(query + ' ORDER BY created_at', params)]
+
+    @staticmethod
+    def _record(row):
+        record = dict(row)
+        record['metadata'] = json.loads(record['metadata'])
+        record['dimensions'] = json.loads(record['dimensions'])
+        return record
+
+    def open(self, digest):
+        """Readable stream of a blob's uncompressed NBT"""
+        return lzma.open(self.backend.open(digest), 'rb')
+
+    def export(self, job_id, destination):
+        """Write a job's structure to ``destination`` as a gzipped .schem file"""
+        record = self.get(job_id)
+        if record is None:
+            raise KeyError(f"No structure stored for job {job_id}")
+        partial = f"{destination}.part"
+        try:
+            with self.open(record['digest']) as source, gzip.open(partial, 'wb') as target:
+                shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+            os.replace(partial, destination)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return destination
+
+    def export_many(self, job_ids, directory, workers=STRUCTURE_STORE_WORKERS):
+        """Export many jobs' structures to ``directory/<job_id>.schem`` in parallel, returning the paths"""
+        os.makedirs(directory, exist_ok=True)
+        with ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(
+                lambda job_id: self.export(job_id, os.path.join(directory, f"{job_id}.schem")), job_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the structure store")
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='store loose .schem files, indexed by file name')
+    import_parser.add_argument('files', nargs='+')
+    import_parser.add_argument('--keep', action='store_true', help='keep the files after storing them')
+    list_parser = commands.add_parser('list', help='print index records as JSON lines')
+    list_parser.add_argument('--name')
+    export_parser = commands.add_parser('export', help='write structures out as .schem files')
+    export_parser.add_argument('job_ids', nargs='*')
+    export_parser.add_argument('--all', action='store_true', help='export every stored structure')
+    export_parser.add_argument('--output', default='exported', help='directory to write to')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    store = StructureStore()
+    if args.command == 'import':
+        names = [os.path.splitext(os.path.basename(path))[0] for path in args.files]
+        blobs = store.put_many((name, path, name, None, None) for name, path in zip(names, args.files))
+        if not args.keep:
+            for path in args.files:
+                os.remove(path)
+        print(f"Stored {len(blobs)} files as {len({blob['digest'] for blob in blobs})} blobs, "
+              f"{sum(blob['stored_size'] for blob in blobs)} of {sum(blob['size'] for blob in blobs)} bytes")
+    elif args.command == 'list':
+        for record in store.find(name=args.name):
+            print(json.dumps(record))
+    else:
+        job_ids = [record['job_id'] for record in store.find()] if args.all else args.job_ids
+        if not job_ids:
+            parser.error('export needs job IDs or --all')
+        paths = store.export_many(job_ids, args.output)
+        print(f"Exported {len(paths)} structures to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Builds a prebaked server image so new servers start without downloads or world generation.
+
+A warm-up container is started once from base-compose.yml with its /data on a scratch
+directory. It downloads Paper and WorldEdit, renders the configs and generates the world,
+and is then stopped. The directory is baked into an image on top of the server image, and
+a compose template is written that runs the server jar from the image:
+
+    python template_builder.py --tag mc-bench-template:1.20.4
+    MC_COMPOSE_TEMPLATE=template-compose.yml python build_service.py
+
+Each server created from the template gets its own /data volume, which Docker fills from
+the image layers when the container is created, so servers share nothing and the image
+only needs rebuilding when base-compose.yml changes.
+"""
+import os
+import glob
+import shutil
+import logging
+import argparse
+import secrets
+import tempfile
+import time
+import uuid
+import docker
+import yaml
+from readiness import READY_LOG_PATTERN
+
+TEMPLATE_IMAGE = os.getenv('MC_TEMPLATE_IMAGE', 'mc-bench-template:latest')
+TEMPLATE_WARMUP_TIMEOUT = int(os.getenv('MC_TEMPLATE_WARMUP_TIMEOUT', '600'))  # Seconds
+
+# Written by the warm-up run but not part of the template
+TRANSIENT_PATHS = ('logs', 'crash-reports', '*/session.lock', '.rcon-cli.env', '.rcon-cli.yaml')
+
+DOCKERFILE = """FROM {base_image}
+COPY --chown=1000:1000 data /data
+"""
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TemplateError(Exception):
+    pass
+
+
+def _literal_strings(dumper, value):
+    # Keeps the embedded YAML configs readable in the rendered compose file
+    style = '|' if '\n' in value else None
+    return dumper.represent_scalar('tag:yaml.org,2002:str', value, style=style)
+
+
+class ComposeDumper(yaml.SafeDumper):
+    pass
+
+
+ComposeDumper.add_representer(str, _literal_strings)
+
+
+def load_service(base_template):
+    """The mc service of a compose template; its {placeholders} stay in place as strings"""
+    compose = yaml.safe_load(base_template)
+    return compose, compose['services']['mc']
+
+
+def warm_up(client, service, data_dir, timeout=TEMPLATE_WARMUP_TIMEOUT):
+    """Run the server once with /data on ``data_dir`` until the world is generated, then stop it"""
+    environment = dict(service['environment'], RCON_PASSWORD=secrets.token_urlsafe(16))
+    container = client.containers.run(
+        service['image'],
+        name=f"mc-template-{uuid.uuid4().hex[:8]}",
+        environment=environment,
+        volumes={os.path.abspath(data_dir): {'bind': '/data', 'mode': 'rw'}},
+        tty=True,
+        detach=True
+    )
+    logger.info(f"Warming up template server in {container.name}")
+    try:
+        deadline = time.time() + timeout
+        for line in container.logs(stream=True, follow=True):
+            line = line.decode('utf-8', errors='replace')
+            if READY_LOG_PATTERN.search(line):
+                logger.info("Template server finished starting, stopping it")
+                break
+            if time.time() > deadline:
+                raise TemplateError(f"Template server did not start within {timeout} seconds")
+        else:
+            container.reload()
+            raise TemplateError(f"Template server exited during warm-up ({container.status})")
+        # The image saves the world and shuts the server down cleanly on SIGTERM
+        container.stop(timeout=120)
+    finally:
+        container.remove(force=True)
+
+
+def clean_data(data_dir):
+    for pattern in TRANSIENT_PATHS:
+        for path in glob.glob(os.path.join(data_dir, pattern)):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+def find_server_jar(data_dir):
+    jars = sorted(glob.glob(os.path.join(data_dir, '*.jar')), key=os.path.getmtime)
+    if not jars:
+        raise TemplateError(f"No server jar found in {data_dir} after warm-up")
+    return os.path.basename(jars[-1])
+
+
+def build_image(client, base_image, data_dir, tag):
+    """Bake ``data_dir`` into /data of an image on top of ``base_image``"""
+    context = os.path.dirname(os.path.abspath(data_dir))
+    with open(os.path.join(context, 'Dockerfile'), 'w') as f:
+        f.write(DOCKERFILE.format(base_image=base_image))
+    logger.info(f"Building template image {tag}")
+    image, _ = client.images.build(path=context, tag=tag, rm=True)
+    return image
+
+
+def render_template_compose(base_template, tag, server_jar):
+    """A compose template for servers started from the template image.
+
+    The server runs the baked jar instead of resolving and downloading one, plugins are
+    not downloaded again, and /data is no longer bind-mounted so every container gets
+    its own copy of the template world.
+    """
+    compose, service = load_service(base_template)
+    service['image'] = tag
+    environment = service['environment']
+    environment.pop('PLUGINS', None)
+    environment['TYPE'] = 'CUSTOM'
+    environment['CUSTOM_SERVER'] = f"/data/{server_jar}"
+    volumes = [volume for volume in service.get('volumes', [])
+               if volume.split(':')[1].rstrip('/') not in ('/data', '/data/plugins', '/plugins')]
+    if volumes:
+        service['volumes'] = volumes
+    else:
+        service.pop('volumes', None)
+    return yaml.dump(compose, Dumper=ComposeDumper, sort_keys=False, width=1000)
+
+
+def build_template(client, base_template, tag=TEMPLATE_IMAGE, timeout=TEMPLATE_WARMUP_TIMEOUT):
+    """Warm up a server from ``base_template``, bake it into image ``tag`` and return the template compose file"""
+    _, service = load_service(base_template)
+    work_dir = tempfile.mkdtemp(prefix='mc-template-')
+    try:
+        data_dir = os.path.join(work_dir, 'data')
+        os.makedirs(data_dir)
+        warm_up(client, service, data_dir, timeout)
+        clean_data(data_dir)
+        server_jar = find_server_jar(data_dir)
+        build_image(client, service['image'], data_dir, tag)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return render_template_compose(base_template, tag, server_jar)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a prebaked Minecraft server image")
+    parser.add_argument('--base-compose', default='base-compose.yml', help='compose template to warm up')
+    parser.add_argument('--tag', default=TEMPLATE_IMAGE, help='tag of the template image')
+    parser.add_argument('--output', default='template-compose.yml', help='where to write the compose template')
+    parser.add_argument('--timeout', type=int, default=TEMPLATE_WARMUP_TIMEOUT,
+                        help='seconds to wait for the warm-up server')
+    args = parser.parse_args()
+
+    with open(args.base_compose) as f:
+        base_template = f.read()
+    start = time.time()
+    compose = build_template(docker.from_env(), base_template, args.tag, args.timeout)
+    with open(args.output, 'w') as f:
+        f.write(compose)
+    logger.info(f"Built {args.tag} in {time.time() - start:.0f}s; "
+                f"set MC_COMPOSE_TEMPLATE={args.output} to start servers from it")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 from celery import Celery
-from celery.result import AsyncResult
 import time
 import os
 import redis
@@ -59,36 +58,28 @@ def submit_and_monitor_job():
         task_id = result.id
         logger.info(f"Job submitted with ID: {task_id}")
         
-        # Monitor the job
-        while True:
-            try:
-                # Check job status using AsyncResult
-                async_result = AsyncResult(task_id, app=celery_app)
-                status = async_result.status
-                print(f"Current status: {status}")
-                
-                if status in ['SUCCESS', 'FAILURE']:
-                    # Get the result if available
-                    try:
-                        build_result = async_result.get(timeout=1)
-                        print("\nBuild Result:")
-                        print(f"Status: {build_result.get('status')}")
-                        print(f"Structure Name: {build_result.get('structure_name')}")
-                        print(f"Dimensions: {build_result.get('dimensions')}")
-                        if build_result.get('error'):
-                            print(f"Error: {build_result.get('error')}")
-                    except Exception as e:
-                        print(f"Error getting result: {e}")
-                    break
-                
-                time.sleep(5)  # Wait 5 seconds before checking again
-                
-            except KeyboardInterrupt:
-                print("\nMonitoring interrupted by user")
-                break
-            except Exception as e:
-                print(f"Error monitoring job: {e}")
-                break
+        # Block until the build service publishes the result; stage updates arrive as they happen
+        def on_message(meta):
+            if meta['status'] == 'STARTED':
+                print(f"Current stage: {meta['result'].get('stage')}")
+
+        try:
+            build_result = result.get(timeout=1800, on_message=on_message, propagate=False)
+            print(f"Current status: {result.status}")
+            if result.failed():
+                print(f"Error: {build_result}")
+            else:
+                print("\nBuild Result:")
+                print(f"Status: {build_result.get('status')}")
+                print(f"Structure Name: {build_result.get('structure_name')}")
+                print(f"Structure Digest: {build_result.get('structure_digest')}")
+                print(f"Dimensions: {build_result.get('dimensions')}")
+                if build_result.get('error'):
+                    print(f"Error: {build_result.get('error')}")
+        except KeyboardInterrupt:
+            print("\nMonitoring interrupted by user")
+        except Exception as e:
+            print(f"Error monitoring job: {e}")
     except Exception as e:
         print(f"Error submitting job: {e}")
 
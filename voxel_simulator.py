@@ -0,0 +1,290 @@
+import os
+import time
+import builtins
+import logging
+import numpy as np
+from build_commands import block_state, setblock_command, fill_command
+from build_recorder import BuildRecorder
+from placement_optimizer import MAX_FILL_VOLUME
+
+AIR = 'minecraft:air'
+
+# Upper bounds for a simulated build, beyond which it is rejected
+MAX_SIMULATED_OPERATIONS = int(os.getenv('MAX_SIMULATED_OPERATIONS', '5000000'))
+MAX_SIMULATED_VOLUME = int(os.getenv('MAX_SIMULATED_VOLUME', '33554432'))  # Grid cells, 64MB as uint16
+
+logger = logging.getLogger(__name__)
+
+
+class SimulationError(Exception):
+    pass
+
+
+class SimulationTooLarge(SimulationError):
+    """The build's extent is too large for a dense block grid"""
+    pass
+
+
+def parse_block_state(state):
+    """Split 'minecraft:oak_stairs[facing=north]' into ('minecraft:oak_stairs', {'facing': 'north'})"""
+    if '[' not in state:
+        return state, {}
+    name, properties = state[:-1].split('[', 1)
+    return name, dict(prop.split('=', 1) for prop in properties.split(',') if prop)
+
+
+def matches_filter(state, block_filter):
+    """Check a block state against a /fill replace filter (block name plus optional subset of states)"""
+    name, properties = parse_block_state(state)
+    filter_name, filter_properties = parse_block_state(block_filter)
+    if name != filter_name:
+        return False
+    return all(properties.get(key) == value for key, value in filter_properties.items())
+
+
+class RecordingBuildAPI:
+    """safeSetBlock/safeFill for headless runs: validates arguments like the server-backed
+    versions in mineflayer and records the operations instead of sending commands."""
+
+    def __init__(self, recorder, max_operations=MAX_SIMULATED_OPERATIONS):
+        self.recorder = recorder
+        self.max_operations = max_operations
+
+    def _check_limit(self):
+        if len(self.recorder.operations) >= self.max_operations:
+            raise SimulationError(f"Build exceeds {self.max_operations} block operations")
+
+    def safeSetBlock(self, x, y, z, blockType, options={}):
+        self._check_limit()
+        x, y, z = map(int, (x, y, z))
+        block = block_state(blockType, options.get('blockStates'))
+        mode = options.get('mode')
+        setblock_command(x, y, z, block, mode)  # Validates the mode
+        self.recorder.set_block(x, y, z, block, mode)
+
+    def safeFill(self, x1, y1, z1, x2, y2, z2, blockType, options={}):
+        self._check_limit()
+        x1, y1, z1, x2, y2, z2 = map(int, (x1, y1, z1, x2, y2, z2))
+        block = block_state(blockType, options.get('blockStates'))
+        replaceFilter = None
+        if options.get('replaceFilter'):
+            replaceFilter = block_state(options['replaceFilter'], options.get('replaceFilterStates'))
+        fill_command(x1, y1, z1, x2, y2, z2, block, options.get('mode'), replaceFilter)  # Validates the mode
+        self.recorder.fill(x1, y1, z1, x2, y2, z2, block, options.get('mode'), replaceFilter)
+
+    def namespace(self):
+        """Globals for exec'ing a build function"""
+        return {
+            '__builtins__': builtins,
+            'safeSetBlock': self.safeSetBlock,
+            'safeFill': self.safeFill,
+        }
+
+
+class VoxelGrid:
+    """Dense block grid covering a fixed region, indexed [y, z, x] with palette index 0 = air"""
+
+    def __init__(self, origin, shape):
+        self.origin = origin  # (x, y, z) of grid[0, 0, 0]
+        self.blocks = np.zeros(shape, dtype=np.uint16)
+        self.palette = [AIR]
+        self.palette_index = {AIR: 0}
+
+    def index(self, state):
+        index = self.palette_index.get(state)
+        if index is None:
+            if len(self.palette) > np.iinfo(self.blocks.dtype).max:
+                raise SimulationError("Too many distinct block states")
+            index = self.palette_index[state] = len(self.palette)
+            self.palette.append(state)
+        return index
+
+    def _region(self, x1, y1, z1, x2, y2, z2):
+        ox, oy, oz = self.origin
+        return (slice(min(y1, y2) - oy, max(y1, y2) - oy + 1),
+                slice(min(z1, z2) - oz, max(z1, z2) - oz + 1),
+                slice(min(x1, x2) - ox, max(x1, x2) - ox + 1))
+
+    def set_block(self, x, y, z, block, mode=None):
+        ox, oy, oz = self.origin
+        position = (y - oy, z - oz, x - ox)
+        if mode == 'keep' and self.blocks[position] != 0:
+            return
+        self.blocks[position] = self.index(block)
+
+    def fill(self, x1, y1, z1, x2, y2, z2, block, mode=None, replace_filter=None):
+        region = self.blocks[self._region(x1, y1, z1, x2, y2, z2)]
+        index = self.index(block)
+        if mode in ('hollow', 'outline'):
+            if mode == 'hollow':
+                region[...] = 0
+            for face in (region[0], region[-1], region[:, 0], region[:, -1], region[:, :, 0], region[:, :, -1]):
+                face[...] = index
+        elif mode == 'keep':
+            region[region == 0] = index
+        elif mode == 'replace' and replace_filter:
+            matching = [i for i, state in enumerate(self.palette) if matches_filter(state, replace_filter)]
+            region[np.isin(region, matching)] = index
+        else:
+            region[...] = index
+
+    def bounding_box(self):
+        """(min, max) grid indices [y, z, x] of non-air blocks, or None when empty"""
+        occupied = np.argwhere(self.blocks)
+        if not len(occupied):
+            return None
+        return occupied.min(axis=0), occupied.max(axis=0)
+
+
+def replay_operations(operations, max_fill_volume=MAX_FILL_VOLUME, max_volume=MAX_SIMULATED_VOLUME):
+    """Apply recorded operations to a fresh all-air grid sized to their extent.
+
+    Fills larger than ``max_fill_volume`` are rejected like the server rejects them.
+    Returns the grid and the number of rejected operations.
+    """
+    accepted = []
+    rejected = 0
+    mins = [None, None, None]
+    maxs = [None, None, None]
+    for operation in operations:
+        if operation[0] == 'setblock':
+            corners = (operation[1:4],)
+        else:
+            x1, y1, z1, x2, y2, z2 = operation[1:7]
+            volume = (abs(x2 - x1) + 1) * (abs(y2 - y1) + 1) * (abs(z2 - z1) + 1)
+            if volume > max_fill_volume:
+                rejected += 1
+                continue
+            corners = ((x1, y1, z1), (x2, y2, z2))
+        for corner in corners:
+            for axis, value in enumerate(corner):
+                if mins[axis] is None or value < mins[axis]:
+                    mins[axis] = value
+                if maxs[axis] is None or value > maxs[axis]:
+                    maxs[axis] = value
+        accepted.append(operation)
+
+    if not accepted:
+        return VoxelGrid((0, 0, 0), (1, 1, 1)), rejected
+
+    width, height, length = (maxs[axis] - mins[axis] + 1 for axis in range(3))
+    if width * height * length > max_volume:
+        raise SimulationTooLarge(f"Build extent {width}x{height}x{length} exceeds {max_volume} blocks")
+
+    grid = VoxelGrid(tuple(mins), (height, length, width))
+    for operation in accepted:
+        if operation[0] == 'setblock':
+            grid.set_block(*operation[1:])
+        else:
+            grid.fill(*operation[1:])
+    return grid, rejected
+
+
+def simulate_operations(operations):
+    """Replay recorded operations and summarize the resulting structure"""
+    grid, rejected = replay_operations(operations)
+    bounds = grid.bounding_box()
+    if bounds is None:
+        blocks = np.zeros((1, 1, 1), dtype=np.uint16)
+        dimensions = None
+        origin = grid.origin
+    else:
+        (y1, z1, x1), (y2, z2, x2) = bounds
+        blocks = grid.blocks[y1:y2 + 1, z1:z2 + 1, x1:x2 + 1]
+        dimensions = {
+            'width': int(x2 - x1 + 1),
+            'height': int(y2 - y1 + 1),
+            'depth': int(z2 - z1 + 1)
+        }
+        ox, oy, oz = grid.origin
+        origin = (ox + int(x1), oy + int(y1), oz + int(z1))
+    return {
+        'blocks': blocks,
+        'palette': grid.palette,
+        'origin': origin,
+        'block_count': int(np.count_nonzero(blocks)),
+        'dimensions': dimensions,
+        'operations': len(operations),
+        'rejected_operations': rejected
+    }
+
+
+def summarize_operations(operations, max_fill_volume=MAX_FILL_VOLUME):
+    """simulate_operations' block count and dimensions without a block grid, for builds too spread out for one.
+
+    Nothing is replayed: the block count is the number of non-air blocks written, counting
+    blocks that are written twice or cleared later, and the dimensions are the extent of
+    those writes.
+    """
+    block_count = 0
+    rejected = 0
+    mins = [None, None, None]
+    maxs = [None, None, None]
+    for operation in operations:
+        if operation[0] == 'setblock':
+            corners, block, volume = (operation[1:4],), operation[4], 1
+        else:
+            x1, y1, z1, x2, y2, z2 = operation[1:7]
+            volume = (abs(x2 - x1) + 1) * (abs(y2 - y1) + 1) * (abs(z2 - z1) + 1)
+            if volume > max_fill_volume:
+                rejected += 1
+                continue
+            corners, block = ((x1, y1, z1), (x2, y2, z2)), operation[7]
+        if parse_block_state(block)[0] == AIR:
+            continue
+        block_count += volume
+        for corner in corners:
+            for axis, value in enumerate(corner):
+                if mins[axis] is None or value < mins[axis]:
+                    mins[axis] = value
+                if maxs[axis] is None or value > maxs[axis]:
+                    maxs[axis] = value
+    dimensions = None
+    if block_count:
+        dimensions = {
+            'width': maxs[0] - mins[0] + 1,
+            'height': maxs[1] - mins[1] + 1,
+            'depth': maxs[2] - mins[2] + 1
+        }
+    return {
+        'block_count': block_count,
+        'dimensions': dimensions,
+        'operations': len(operations),
+        'rejected_operations': rejected,
+        'sparse': True
+    }
+
+
+def record_operations(function_definition, max_operations=MAX_SIMULATED_OPERATIONS):
+    """Run a build function against RecordingBuildAPI and return the operations it issued"""
+    recorder = BuildRecorder()
+    exec(function_definition, RecordingBuildAPI(recorder, max_operations).namespace())
+    return recorder.operations
+
+
+def simulate_build(function_definition=None, operations=None):
+    """Run a build function headlessly and return its final block grid, block count and dimensions.
+
+    The function runs in this process; pass the ``operations`` a build_sandbox worker
+    recorded instead to only replay them. Returns a dict with 'status' 'success' plus the
+    simulate_operations fields, or 'status' 'error' with the error raised by the build function.
+    Builds whose extent exceeds MAX_SIMULATED_VOLUME are checked with summarize_operations
+    instead, and their result is marked 'sparse'.
+    """
+    start = time.time()
+    try:
+        if operations is None:
+            operations = record_operations(function_definition)
+        try:
+            result = simulate_operations(operations)
+        except SimulationTooLarge as e:
+            logger.info(f"{e}, checking the build without a block grid")
+            result = summarize_operations(operations)
+    except Exception as e:
+        logger.warning(f"Simulated build failed: {type(e).__name__}: {e}")
+        return {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+    result['status'] = 'success'
+    result['elapsed'] = time.time() - start
+    logger.info(f"Simulated build: {result['block_count']} blocks, dimensions {result['dimensions']}, "
+                f"{result['operations']} operations in {result['elapsed']:.3f}s")
+    return result